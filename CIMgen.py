@@ -1,173 +1,155 @@
 import os
 import xmltodict
-from time import time
+from time import time, perf_counter
 import json
+import importlib
+import output
+import parse_cache
+import report
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import repeat
+import multiprocessing
+import threading
 
 import logging
 
+try:
+    from lxml import etree
+except ImportError:
+    import xml.etree.ElementTree as etree
+
 logger = logging.getLogger(__name__)
 
 
+# Characters replaced in comments and labels of the RDFS entries
+_comment_translation = str.maketrans(
+    {
+        "–": "-",
+        "“": '"',
+        "”": '"',
+        "’": "'",
+        "°": "[SYMBOL REMOVED]",
+        "º": "[SYMBOL REMOVED]",
+        "\n": " ",
+    }
+)
+_label_translation = str.maketrans(
+    {"–": "-", "“": '"', "”": '"', "’": "'", "°": "", "\n": " "}
+)
+
+
+# One rdf:Description of a schema file. All fields are decoded once when the entry is created, fields which are not
+# part of the description are None.
 class RDFSEntry:
+    __slots__ = (
+        "about",
+        "associationUsed",
+        "comment",
+        "dataType",
+        "domain",
+        "fixed",
+        "keyword",
+        "title",
+        "inverseRole",
+        "label",
+        "multiplicity",
+        "range",
+        "stereotype",
+        "type",
+        "version_iri",
+        "subClassOf",
+    )
+
+    # The keys of the dictionary returned by asJson and the fields they are taken from, in the order of the dictionary
+    _json_keys = (
+        ("about", "about"),
+        ("comment", "comment"),
+        ("dataType", "dataType"),
+        ("domain", "domain"),
+        ("isFixed", "fixed"),
+        ("label", "label"),
+        ("multiplicity", "multiplicity"),
+        ("range", "range"),
+        ("stereotype", "stereotype"),
+        ("type", "type"),
+        ("subClassOf", "subClassOf"),
+        ("inverseRole", "inverseRole"),
+        ("associationUsed", "associationUsed"),
+    )
+
     def __init__(self, jsonObject):
-        self.jsonDefinition = jsonObject
-        return
+        get = jsonObject.get
+        value = get("$rdf:about")
+        self.about = (
+            None
+            if value is None
+            else RDFSEntry._get_rid_of_hash(RDFSEntry._get_about_or_resource(value))
+        )
+        value = get("cims:AssociationUsed")
+        self.associationUsed = (
+            None if value is None else RDFSEntry._extract_string(value)
+        )
+        value = get("rdfs:comment")
+        self.comment = (
+            None
+            if value is None
+            else RDFSEntry._extract_text(value).translate(_comment_translation)
+        )
+        value = get("cims:dataType")
+        self.dataType = None if value is None else RDFSEntry._extract_string(value)
+        value = get("rdfs:domain")
+        self.domain = (
+            None
+            if value is None
+            else RDFSEntry._get_rid_of_hash(RDFSEntry._extract_string(value))
+        )
+        value = get("cims:isFixed")
+        self.fixed = None if value is None else RDFSEntry._extract_text(value)
+        self.keyword = get("dcat:keyword")
+        value = get("dct:title")
+        self.title = None if value is None else RDFSEntry._extract_text(value)
+        value = get("cims:inverseRoleName")
+        self.inverseRole = (
+            None
+            if value is None
+            else RDFSEntry._get_rid_of_hash(RDFSEntry._extract_string(value))
+        )
+        value = get("rdfs:label")
+        self.label = (
+            None
+            if value is None
+            else RDFSEntry._extract_text(value).translate(_label_translation)
+        )
+        value = get("cims:multiplicity")
+        self.multiplicity = (
+            None
+            if value is None
+            else RDFSEntry._get_rid_of_hash(RDFSEntry._extract_string(value))
+        )
+        value = get("rdfs:range")
+        self.range = None if value is None else RDFSEntry._extract_string(value)
+        value = get("cims:stereotype")
+        self.stereotype = None if value is None else RDFSEntry._extract_string(value)
+        value = get("rdf:type")
+        self.type = None if value is None else RDFSEntry._extract_string(value)
+        value = get("owl:versionIRI")
+        self.version_iri = None if value is None else RDFSEntry._extract_string(value)
+        value = get("rdfs:subClassOf")
+        self.subClassOf = (
+            None
+            if value is None
+            else RDFSEntry._get_rid_of_hash(RDFSEntry._extract_string(value))
+        )
 
+    # Returns the attribute or instance dictionary used in the class details, with the fields which are set
     def asJson(self):
         jsonObject = {}
-        if self.about() != None:
-            jsonObject["about"] = self.about()
-        if self.comment() != None:
-            jsonObject["comment"] = self.comment()
-        if self.dataType() != None:
-            jsonObject["dataType"] = self.dataType()
-        if self.domain() != None:
-            jsonObject["domain"] = self.domain()
-        if self.fixed() != None:
-            jsonObject["isFixed"] = self.fixed()
-        if self.label() != None:
-            jsonObject["label"] = self.label()
-        if self.multiplicity() != None:
-            jsonObject["multiplicity"] = self.multiplicity()
-        if self.range() != None:
-            jsonObject["range"] = self.range()
-        if self.stereotype() != None:
-            jsonObject["stereotype"] = self.stereotype()
-        if self.type() != None:
-            jsonObject["type"] = self.type()
-        if self.subClassOf() != None:
-            jsonObject["subClassOf"] = self.subClassOf()
-        if self.inverseRole() != None:
-            jsonObject["inverseRole"] = self.inverseRole()
-        if self.associationUsed() != None:
-            jsonObject["associationUsed"] = self.associationUsed()
+        for key, field in RDFSEntry._json_keys:
+            value = getattr(self, field)
+            if value is not None:
+                jsonObject[key] = value
         return jsonObject
 
-    def about(self):
-        if "$rdf:about" in self.jsonDefinition:
-            return RDFSEntry._get_rid_of_hash(
-                RDFSEntry._get_about_or_resource(self.jsonDefinition["$rdf:about"])
-            )
-        else:
-            return None
-
-    def associationUsed(self):
-        if "cims:AssociationUsed" in self.jsonDefinition:
-            return RDFSEntry._extract_string(
-                self.jsonDefinition["cims:AssociationUsed"]
-            )
-        else:
-            return None
-
-    def comment(self):
-        if "rdfs:comment" in self.jsonDefinition:
-            return (
-                RDFSEntry._extract_text(self.jsonDefinition["rdfs:comment"])
-                .replace("–", "-")
-                .replace("“", '"')
-                .replace("”", '"')
-                .replace("’", "'")
-                .replace("°", "[SYMBOL REMOVED]")
-                .replace("º", "[SYMBOL REMOVED]")
-                .replace("\n", " ")
-            )
-        else:
-            return None
-
-    def dataType(self):
-        if "cims:dataType" in self.jsonDefinition:
-            return RDFSEntry._extract_string(self.jsonDefinition["cims:dataType"])
-        else:
-            return None
-
-    def domain(self):
-        if "rdfs:domain" in self.jsonDefinition:
-            return RDFSEntry._get_rid_of_hash(
-                RDFSEntry._extract_string(self.jsonDefinition["rdfs:domain"])
-            )
-        else:
-            return None
-
-    def fixed(self):
-        if "cims:isFixed" in self.jsonDefinition:
-            return RDFSEntry._extract_text(self.jsonDefinition["cims:isFixed"])
-        else:
-            return None
-
-    def keyword(self):
-        if "dcat:keyword" in self.jsonDefinition:
-            return self.jsonDefinition["dcat:keyword"]
-        else:
-            return None
-
-    def title(self):
-        if "dct:title" in self.jsonDefinition:
-            return RDFSEntry._extract_text(self.jsonDefinition["dct:title"])
-        else:
-            return None
-
-    def inverseRole(self):
-        if "cims:inverseRoleName" in self.jsonDefinition:
-            return RDFSEntry._get_rid_of_hash(
-                RDFSEntry._extract_string(self.jsonDefinition["cims:inverseRoleName"])
-            )
-        else:
-            return None
-
-    def label(self):
-        if "rdfs:label" in self.jsonDefinition:
-            return (
-                RDFSEntry._extract_text(self.jsonDefinition["rdfs:label"])
-                .replace("–", "-")
-                .replace("“", '"')
-                .replace("”", '"')
-                .replace("’", "'")
-                .replace("°", "")
-                .replace("\n", " ")
-            )
-        else:
-            return None
-
-    def multiplicity(self):
-        if "cims:multiplicity" in self.jsonDefinition:
-            return RDFSEntry._get_rid_of_hash(
-                RDFSEntry._extract_string(self.jsonDefinition["cims:multiplicity"])
-            )
-        else:
-            return None
-
-    def range(self):
-        if "rdfs:range" in self.jsonDefinition:
-            return RDFSEntry._extract_string(self.jsonDefinition["rdfs:range"])
-        else:
-            return None
-
-    def stereotype(self):
-        if "cims:stereotype" in self.jsonDefinition:
-            return RDFSEntry._extract_string(self.jsonDefinition["cims:stereotype"])
-        else:
-            return None
-
-    def type(self):
-        if "rdf:type" in self.jsonDefinition:
-            return RDFSEntry._extract_string(self.jsonDefinition["rdf:type"])
-        else:
-            return None
-
-    def version_iri(self):
-        if "owl:versionIRI" in self.jsonDefinition:
-            return RDFSEntry._extract_string(self.jsonDefinition["owl:versionIRI"])
-        else:
-            return None
-
-    def subClassOf(self):
-        if "rdfs:subClassOf" in self.jsonDefinition:
-            return RDFSEntry._get_rid_of_hash(
-                RDFSEntry._extract_string(self.jsonDefinition["rdfs:subClassOf"])
-            )
-        else:
-            return None
-
     # Extracts the text out of the dictionary after xmltodict, text is labeled by key '_'
     def _extract_text(object_dic):
         if isinstance(object_dic, list):
@@ -218,19 +200,43 @@ class RDFSEntry:
 
 
 class CIMComponentDefinition:
+    __slots__ = (
+        "attribute_list",
+        "attribute_index",
+        "comment",
+        "instance_list",
+        "origin_list",
+        "origin_names",
+        "profile_mask",
+        "super",
+        "subclasses",
+        "superclasses",
+    )
+
     def __init__(self, rdfsEntry):
         self.attribute_list = []
-        self.comment = rdfsEntry.comment()
+        # first attribute of the list with a label, by label
+        self.attribute_index = {}
+        self.comment = rdfsEntry.comment
         self.instance_list = []
         self.origin_list = []
-        self.super = rdfsEntry.subClassOf()
+        # the origins of the origin list, by name
+        self.origin_names = set()
+        # the bits of the origins, see _merge_classes
+        self.profile_mask = 0
+        self.super = rdfsEntry.subClassOf
         self.subclasses = []
+        self.superclasses = []
 
     def attributes(self):
         return self.attribute_list
 
+    def attribute(self, label):
+        return self.attribute_index.get(label)
+
     def addAttribute(self, attribute):
         self.attribute_list.append(attribute)
+        self.attribute_index.setdefault(attribute["label"], attribute)
 
     def has_instances(self):
         return len(self.instance_list) > 0
@@ -244,13 +250,25 @@ class CIMComponentDefinition:
 
     def addAttributes(self, attributes):
         for attribute in attributes:
-            self.attribute_list.append(attribute)
+            self.addAttribute(attribute)
+
+    def setAttributes(self, attributes):
+        self.attribute_list = []
+        self.attribute_index = {}
+        self.addAttributes(attributes)
 
     def origins(self):
         return self.origin_list
 
+    def hasOrigin(self, name):
+        return name in self.origin_names
+
     def addOrigin(self, origin):
         self.origin_list.append(origin)
+        self.origin_names.add(origin["origin"])
+
+    def profileMask(self):
+        return self.profile_mask
 
     def superClass(self):
         return self.super
@@ -264,6 +282,12 @@ class CIMComponentDefinition:
     def setSubClasses(self, classes):
         self.subclasses = classes
 
+    def superClasses(self):
+        return self.superclasses
+
+    def setSuperClasses(self, classes):
+        self.superclasses = classes
+
     def _simple_float_attribute(attr):
         if "dataType" in attr:
             return attr["label"] == "value" and attr["dataType"] == "#Float"
@@ -297,22 +321,16 @@ def get_profile_name(descriptions):
     for list_elem in descriptions:
         # only for CGMES-Standard
         rdfsEntry = RDFSEntry(list_elem)
-        if rdfsEntry.stereotype() == "Entsoe":
-            return rdfsEntry.about()
+        if rdfsEntry.stereotype == "Entsoe":
+            return rdfsEntry.about
 
 
 def get_short_profile_name(descriptions):
     for list_elem in descriptions:
         # only for CGMES-Standard
         rdfsEntry = RDFSEntry(list_elem)
-        if rdfsEntry.label() == "shortName":
-            return rdfsEntry.fixed()
-
-
-short_package_name = {}
-package_listed_by_short_name = {}
-
-profiles = {}
+        if rdfsEntry.label == "shortName":
+            return rdfsEntry.fixed
 
 
 def _rdfs_entry_types(rdfs_entry: RDFSEntry, version) -> list:
@@ -320,15 +338,15 @@ def _rdfs_entry_types(rdfs_entry: RDFSEntry, version) -> list:
     Determine the types of RDFS entry. In some case an RDFS entry can be of more than 1 type.
     """
     entry_types = []
-    if rdfs_entry.type() != None:
-        if rdfs_entry.type() == "http://www.w3.org/2000/01/rdf-schema#Class":  # NOSONAR
+    if rdfs_entry.type != None:
+        if rdfs_entry.type == "http://www.w3.org/2000/01/rdf-schema#Class":  # NOSONAR
             entry_types.append("class")
         if (
-            rdfs_entry.type() == "http://www.w3.org/1999/02/22-rdf-syntax-ns#Property"
+            rdfs_entry.type == "http://www.w3.org/1999/02/22-rdf-syntax-ns#Property"
         ):  # NOSONAR
             entry_types.append("property")
         if (
-            rdfs_entry.type()
+            rdfs_entry.type
             != "http://iec.ch/TC57/1999/rdf-schema-extensions-19990926#ClassCategory"
         ):  # NOSONAR
             entry_types.append("rest_non_class_category")
@@ -347,16 +365,16 @@ def _rdfs_entry_types(rdfs_entry: RDFSEntry, version) -> list:
 
 def _entry_types_version_2(rdfs_entry: RDFSEntry) -> list:
     entry_types = []
-    if rdfs_entry.stereotype() != None:
-        if rdfs_entry.stereotype() == "Entsoe" and rdfs_entry.about()[-7:] == "Version":
+    if rdfs_entry.stereotype != None:
+        if rdfs_entry.stereotype == "Entsoe" and rdfs_entry.about[-7:] == "Version":
             entry_types.append("profile_name_v2_4")
         if (
-            rdfs_entry.stereotype()
+            rdfs_entry.stereotype
             == "http://iec.ch/TC57/NonStandard/UML#attribute"  # NOSONAR
-            and rdfs_entry.label()[0:7] == "baseURI"
+            and rdfs_entry.label[0:7] == "baseURI"
         ):
             entry_types.append("profile_iri_v2_4")
-        if rdfs_entry.label() == "shortName":
+        if rdfs_entry.label == "shortName":
             entry_types.append("short_profile_name_v2_4")
     return entry_types
 
@@ -364,13 +382,13 @@ def _entry_types_version_2(rdfs_entry: RDFSEntry) -> list:
 def _entry_types_version_3(rdfs_entry: RDFSEntry) -> list:
     entry_types = []
     if (
-        rdfs_entry.type()
+        rdfs_entry.type
         == "http://iec.ch/TC57/1999/rdf-schema-extensions-19990926#ClassCategory"
     ):  # NOSONAR
         entry_types.append("profile_name_v3")
-    if rdfs_entry.about() == "Ontology":
+    if rdfs_entry.about == "Ontology":
         entry_types.append("profile_iri_v3")
-    if rdfs_entry.keyword() is not None:
+    if rdfs_entry.keyword is not None:
         entry_types.append("short_profile_name_v3")
 
     return entry_types
@@ -380,13 +398,19 @@ def _add_class(classes_map, rdfs_entry):
     """
     Add class component to classes map
     """
-    if rdfs_entry.label() in classes_map:
-        logger.error("Class {} already exists".format(rdfs_entry.label()))
-    if rdfs_entry.label() != "String":
-        classes_map[rdfs_entry.label()] = CIMComponentDefinition(rdfs_entry)
-
-
-def _add_profile_to_packages(profile_name, short_profile_name, profile_iri):
+    if rdfs_entry.label in classes_map:
+        logger.error("Class {} already exists".format(rdfs_entry.label))
+    if rdfs_entry.label != "String":
+        classes_map[rdfs_entry.label] = CIMComponentDefinition(rdfs_entry)
+
+
+def _add_profile_to_packages(
+    profile_name,
+    short_profile_name,
+    profile_iri,
+    profiles,
+    package_listed_by_short_name,
+):
     """
     Add or append profile_iri
     """
@@ -400,44 +424,126 @@ def _add_profile_to_packages(profile_name, short_profile_name, profile_iri):
         package_listed_by_short_name[short_profile_name].append(profile_iri)
 
 
-def _parse_rdf(input_dic, version):
+_XML_NAMESPACE = "http://www.w3.org/XML/1998/namespace"
+
+
+# Element and attribute names are reported by iterparse as {uri}name, xmltodict
+# keeps them as prefix:name like they are written in the document.
+def _prefixed_name(name, prefixes):
+    if name[0] == "{":
+        uri, local_name = name[1:].split("}", 1)
+        return prefixes[uri] + ":" + local_name
+    return name
+
+
+# Converts an element into the same structure that
+# xmltodict.parse(attr_prefix="$", cdata_key="_") creates for it, so that
+# RDFSEntry does not need to know which parser was used.
+def _element_to_dict(element, prefixes):
+    item = {}
+    for name, value in element.attrib.items():
+        item["$" + _prefixed_name(name, prefixes)] = value
+    text = element.text or ""
+    for child in element:
+        text += child.tail or ""
+        # skip comments and processing instructions
+        if not isinstance(child.tag, str):
+            continue
+        key = _prefixed_name(child.tag, prefixes)
+        value = _element_to_dict(child, prefixes)
+        if key not in item:
+            item[key] = value
+        elif isinstance(item[key], list):
+            item[key].append(value)
+        else:
+            item[key] = [item[key], value]
+    text = text.strip()
+    if not item:
+        return text or None
+    if text:
+        item["_"] = text
+    return item
+
+
+def _iter_descriptions(rdf_file):
+    """Yields the rdf:Description elements of an RDF file (path or binary file object) one at a time
+
+    The file is parsed incrementally with iterparse (lxml if it is installed, the standard library otherwise). Each
+    description is converted to a dictionary as soon as its end tag is read and removed from the tree right away, so
+    that only one description is held in memory at a time.
+    """
+    prefixes = {_XML_NAMESPACE: "xml"}
+    root = None
+    depth = 0
+    for event, item in etree.iterparse(rdf_file, events=("start", "end", "start-ns")):
+        if event == "start-ns":
+            prefix, uri = item
+            prefixes.setdefault(uri, prefix)
+        elif event == "start":
+            if root is None:
+                root = item
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 1:
+                if _prefixed_name(item.tag, prefixes) == "rdf:Description":
+                    yield _element_to_dict(item, prefixes)
+                root.remove(item)
+
+
+def _iter_descriptions_xmltodict(rdf_file):
+    if isinstance(rdf_file, str):
+        with open(rdf_file, "rb") as f:
+            xmlstring = f.read()
+    else:
+        xmlstring = rdf_file.read()
+
+    # parse RDF files and create a dictionary from the RDF file
+    parse_result = xmltodict.parse(
+        xmlstring, attr_prefix="$", cdata_key="_", dict_constructor=dict
+    )
+    return parse_result["rdf:RDF"]["rdf:Description"]
+
+
+parsers = {"iterparse": _iter_descriptions, "xmltodict": _iter_descriptions_xmltodict}
+
+
+def _parse_rdf(descriptions, version):
     classes_map = {}
     profile_name = ""
     profile_iri = None
     attributes = []
     instances = []
 
-    # Generates list with dictionaries as elements
-    descriptions = input_dic["rdf:RDF"]["rdf:Description"]
-
-    # Iterate over list elements
+    # Iterate over the rdf:Description elements
     for list_elem in descriptions:
         rdfsEntry = RDFSEntry(list_elem)
-        object_dic = rdfsEntry.asJson()
         rdfs_entry_types = _rdfs_entry_types(rdfsEntry, version)
 
         if "class" in rdfs_entry_types:
             _add_class(classes_map, rdfsEntry)
-        if "property" in rdfs_entry_types:
-            attributes.append(object_dic)
-        if "rest_non_class_category" in rdfs_entry_types:
-            instances.append(object_dic)
+        if (
+            "property" in rdfs_entry_types
+            or "rest_non_class_category" in rdfs_entry_types
+        ):
+            object_dic = rdfsEntry.asJson()
+            if "property" in rdfs_entry_types:
+                attributes.append(object_dic)
+            if "rest_non_class_category" in rdfs_entry_types:
+                instances.append(object_dic)
         if "profile_name_v2_4" in rdfs_entry_types:
-            profile_name = rdfsEntry.about()
+            profile_name = rdfsEntry.about
         if "profile_name_v3" in rdfs_entry_types:
-            profile_name = rdfsEntry.label()
-        if "short_profile_name_v2_4" in rdfs_entry_types and rdfsEntry.fixed():
-            short_profile_name = rdfsEntry.fixed()
+            profile_name = rdfsEntry.label
+        if "short_profile_name_v2_4" in rdfs_entry_types and rdfsEntry.fixed:
+            short_profile_name = rdfsEntry.fixed
         if "short_profile_name_v3" in rdfs_entry_types:
-            short_profile_name = rdfsEntry.keyword()
-        if "profile_iri_v2_4" in rdfs_entry_types and rdfsEntry.fixed():
-            profile_iri = rdfsEntry.fixed()
+            short_profile_name = rdfsEntry.keyword
+        if "profile_iri_v2_4" in rdfs_entry_types and rdfsEntry.fixed:
+            profile_iri = rdfsEntry.fixed
         if "profile_iri_v3" in rdfs_entry_types:
-            profile_iri = rdfsEntry.version_iri()
+            profile_iri = rdfsEntry.version_iri
 
-    short_package_name[profile_name] = short_profile_name
-    package_listed_by_short_name[short_profile_name] = []
-    _add_profile_to_packages(profile_name, short_profile_name, profile_iri)
     # Add attributes to corresponding class
     for attribute in attributes:
         clarse = attribute["domain"]
@@ -456,13 +562,115 @@ def _parse_rdf(input_dic, version):
         else:
             logger.info("Class {} for instance {} not found.".format(clarse, instance))
 
-    return {short_profile_name: classes_map}
+    # The profile information is returned rather than stored right away, so that files can be parsed in worker
+    # processes. It is registered by _add_profile in the order of the files.
+    return {
+        "profile_name": profile_name,
+        "short_profile_name": short_profile_name,
+        "profile_iri": profile_iri,
+        "classes": {short_profile_name: classes_map},
+    }
+
+
+# The state of one generation: its options, its report and the profiles registered while the schema files are parsed.
+# A context is created for every generation and passed through parse, merge and emit. Nothing a generation changes is
+# stored at module level, so generations in several threads of one process do not interfere.
+class GenerationContext:
+    def __init__(
+        self,
+        version,
+        parser="iterparse",
+        executor=None,
+        incremental=False,
+        cache_dir=None,
+        cache_size=parse_cache.default_max_size,
+        run_report=None,
+        langpack_options=None,
+    ):
+        self.version = version
+        self.parser = parser
+        self.executor = executor
+        self.incremental = incremental
+        self.cache_dir = cache_dir
+        self.cache_size = cache_size
+        self.run_report = run_report if run_report is not None else report.RunReport()
+        # output options of the langPacks by name, see langPack.options
+        self.langpack_options = dict(langpack_options or {})
+        # profile name -> short profile name
+        self.short_package_name = {}
+        # short profile name -> profile IRIs, passed to langPack.setup
+        self.package_listed_by_short_name = {}
+        # profile name -> profile IRIs
+        self.profiles = {}
+        # short profile name -> bit of the profile in the profile masks, see _merge_classes
+        self.profile_bits = {}
+
+    def add_profile(self, parsed):
+        self.short_package_name[parsed["profile_name"]] = parsed["short_profile_name"]
+        self.package_listed_by_short_name[parsed["short_profile_name"]] = []
+        _add_profile_to_packages(
+            parsed["profile_name"],
+            parsed["short_profile_name"],
+            parsed["profile_iri"],
+            self.profiles,
+            self.package_listed_by_short_name,
+        )
+
+
+# Version of the parse result, it is part of the parse cache keys. It has to be increased whenever _parse_rdf or the
+# classes it returns change, so that results of an older CIMgen are not loaded from the cache.
+parser_version = 5
+
+
+# Parses one RDF file and returns the result of _parse_rdf and the time spent reading the file, parsing the XML and
+# in _parse_rdf itself (or loading the result from the parse cache), see report.py
+def _parse_file(file_path, version, parser, cache_dir=None):
+    timings = {}
+    if cache_dir is not None:
+        t0 = perf_counter()
+        cache_key = parse_cache.key(file_path, version, parser_version)
+        parsed = parse_cache.load(cache_dir, cache_key)
+        timings["parse_cache"] = perf_counter() - t0
+        if parsed is not None:
+            logger.info(
+                'Loaded parsed file "%s" from cache', os.path.basename(file_path)
+            )
+            return parsed, timings
+    logger.info('Start of parsing file "%s"', os.path.basename(file_path))
+    t0 = perf_counter()
+    with open(file_path, "rb") as f:
+        rdf_file = report.TimedFile(f, timings, "read")
+        # xmltodict parses the whole file here, iterparse while the descriptions are iterated
+        t1 = perf_counter()
+        descriptions = parsers[parser](rdf_file)
+        timings["xml"] = perf_counter() - t1
+        descriptions = report.timed_iter(descriptions, timings, "xml")
+        parsed = _parse_rdf(descriptions, version)
+    # reading the file happens while the XML is parsed, and both while _parse_rdf iterates over the descriptions
+    timings["parse_rdf"] = perf_counter() - t0 - timings["xml"]
+    timings["xml"] -= timings["read"]
+    if cache_dir is not None:
+        t0 = perf_counter()
+        parse_cache.store(cache_dir, cache_key, parsed)
+        timings["parse_cache"] += perf_counter() - t0
+    return parsed, timings
 
 
 # This function extracts all information needed for the creation of the python class files like the comments or the
 # class name. After the extraction the function write_files is called to write the files with the template engine
-# chevron
-def _write_python_files(elem_dict, langPack, outputPath, version):
+# chevron. The langPack sees the run in three steps: setup is called once before any class is rendered, run_template
+# once for every class, and finalize (if the langPack has one) once after all classes are rendered, with the class
+# details of all classes, to write the files which depend on more than one class.
+def _write_python_files(elem_dict, langPack, outputPath, context):
+    version = context.version
+    executor = context.executor
+    incremental = context.incremental
+    run_report = context.run_report
+    # outputPath can be an output target, see output.py. Into a directory the files are written by the worker processes,
+    # into an archive by this process.
+    output_target = output.as_output(outputPath)
+    outputPath = output_target.path
+    write_in_workers = isinstance(output_target, output.Directory)
     float_classes = {}
     enum_classes = {}
 
@@ -473,24 +681,46 @@ def _write_python_files(elem_dict, langPack, outputPath, version):
         if elem_dict[class_definition].has_instances():
             enum_classes[class_definition] = True
 
-    langPack.set_float_classes(float_classes)
-    langPack.set_enum_classes(enum_classes)
-
+    # Each class is a separate work item. Everything the langPack needs to render a class, including the float and
+    # enum classes, is part of its class details, so the items can be rendered in any order and in worker processes.
+    # The langPacks change the class details while rendering, so the attributes, instances and origins are copied: the
+    # class model is shared by all langPacks generated from one parse and must stay unchanged.
+    attributes_by_class = {}
+    for class_name in elem_dict.keys():
+        attributes_by_class[class_name] = _find_multiple_attributes(
+            elem_dict[class_name].attributes()
+        )
+    hierarchy = getattr(langPack, "hierarchy_details", ())
+    work_items = []
     for class_name in elem_dict.keys():
         class_details = {
-            "attributes": _find_multiple_attributes(elem_dict[class_name].attributes()),
+            "attributes": _copy_dicts(attributes_by_class[class_name]),
             "ClassLocation": langPack.get_class_location(
                 class_name, elem_dict, outputPath
             ),
             "class_name": class_name,
-            "class_origin": elem_dict[class_name].origins(),
-            "instances": elem_dict[class_name].instances(),
+            "class_origin": _copy_dicts(elem_dict[class_name].origins()),
+            "instances": _copy_dicts(elem_dict[class_name].instances()),
             "has_instances": elem_dict[class_name].has_instances(),
             "is_a_float": elem_dict[class_name].is_a_float(),
-            "langPack": langPack,
+            "float_classes": float_classes,
+            "enum_classes": enum_classes,
             "sub_class_of": elem_dict[class_name].superClass(),
-            "sub_classes": elem_dict[class_name].subClasses(),
+            "sub_classes": list(elem_dict[class_name].subClasses()),
+            "super_classes": list(elem_dict[class_name].superClasses()),
+            "profile_mask": elem_dict[class_name].profileMask(),
+            "profile_bits": context.profile_bits,
+            "options": context.langpack_options,
         }
+        if "inherited_attributes" in hierarchy:
+            # the attributes of the parent classes, starting with the direct parent class
+            class_details["inherited_attributes"] = [
+                {
+                    "super_class": super_class,
+                    "attributes": _copy_dicts(attributes_by_class[super_class]),
+                }
+                for super_class in elem_dict[class_name].superClasses()
+            ]
 
         # extract comments
         if elem_dict[class_name].comment:
@@ -501,7 +731,135 @@ def _write_python_files(elem_dict, langPack, outputPath, version):
                 attribute["comment"] = attribute["comment"].replace('"', "`")
                 attribute["comment"] = attribute["comment"].replace("'", "`")
 
-        _write_files(class_details, outputPath, version)
+        work_items.append(class_details)
+
+    t0 = perf_counter()
+    # langPacks which have output options get them in setup as well
+    if hasattr(langPack, "options"):
+        langPack.setup(
+            output_target,
+            context.package_listed_by_short_name,
+            context.langpack_options,
+        )
+    else:
+        langPack.setup(output_target, context.package_listed_by_short_name)
+    run_report.add_phases({"setup": perf_counter() - t0})
+
+    all_items = work_items
+    if incremental:
+        manifest = output.load_manifest(outputPath)
+        generator_fingerprint = output.fingerprint(_generator_sources(langPack))
+        manifest_classes = {}
+        changed_items = []
+        for class_details in work_items:
+            class_name = class_details["class_name"]
+            class_hash = output.class_hash(
+                _rendered_details(class_details, hierarchy),
+                version,
+                generator_fingerprint,
+            )
+            entry = manifest.pop(class_name, {"hash": None, "files": []})
+            if entry["hash"] == class_hash and output.files_exist(
+                outputPath, entry["files"]
+            ):
+                manifest_classes[class_name] = entry
+            else:
+                manifest_classes[class_name] = {
+                    "hash": class_hash,
+                    "files": entry["files"],
+                }
+                changed_items.append(class_details)
+        # the classes left in the old manifest are not generated anymore
+        for entry in manifest.values():
+            output.remove_files(outputPath, entry["files"])
+        work_items = changed_items
+    run_report.count("rendered_classes", len(work_items))
+
+    emitted = _map(
+        executor,
+        _emit_class,
+        repeat(langPack.__name__),
+        work_items,
+        repeat(outputPath),
+        repeat(version),
+        repeat(incremental),
+        repeat(write_in_workers),
+        chunksize=16,
+    )
+    written_files = []
+    for files, timings in emitted:
+        if not write_in_workers:
+            t0 = perf_counter()
+            for filename in files:
+                output_target.write(filename, files[filename])
+            timings["write"] += perf_counter() - t0
+        written_files.append(list(files))
+        run_report.count("written_files", len(files))
+        run_report.add_phases(timings)
+
+    if incremental:
+        for class_details, filenames in zip(work_items, written_files):
+            entry = manifest_classes[class_details["class_name"]]
+            output.remove_files(outputPath, set(entry["files"]) - set(filenames))
+            entry["files"] = filenames
+        output.save_manifest(outputPath, manifest_classes)
+
+    if hasattr(langPack, "finalize"):
+        t0 = perf_counter()
+        langPack.finalize(output_target, all_items)
+        run_report.add_phases({"finalize": perf_counter() - t0})
+
+
+# The class details which depend on other classes. A langPack lists those its templates render in its
+# hierarchy_details, the inherited attributes are only built for the langPacks which list them. The superclasses are
+# always part of the class details, for langPack.finalize.
+hierarchy_details = ("sub_classes", "super_classes", "inherited_attributes")
+
+# The class details only read by langPack.finalize, which gets the class details of all classes in every run
+finalize_details = ("profile_mask", "profile_bits")
+
+
+# Returns the class details the files of a class are rendered from, which are hashed in incremental mode. The class
+# details a langPack does not render are left out, so that a change to another class, e.g. to a parent class, only
+# renders the class again if its files can change.
+def _rendered_details(class_details, hierarchy):
+    rendered = {}
+    for key in class_details:
+        if key in hierarchy or key not in hierarchy_details + finalize_details:
+            rendered[key] = class_details[key]
+    return rendered
+
+
+# The files that determine what the langPack renders for a class model: the generator, the langPack and its templates
+def _generator_sources(langPack):
+    sources = [__file__, langPack.__file__]
+    for filename in os.listdir(langPack.template_dir):
+        sources.append(os.path.join(langPack.template_dir, filename))
+    return sources
+
+
+# Renders and writes the files of one class and returns their names and the time spent rendering and writing them. The
+# langPack module can not be pickled, so it is passed by name and added to the class details here, where the templates
+# look up their lambdas. Existing files are only replaced in incremental mode, where the manifest has decided that they
+# are out of date, and only if their content changed. If write is not set, the rendered files are returned by name
+# instead, to be written into an archive by the main process.
+def _emit_class(
+    langPack_name, class_details, outputPath, version, overwrite=False, write=True
+):
+    t0 = perf_counter()
+    class_details["langPack"] = importlib.import_module(langPack_name)
+    files = _write_files(class_details, outputPath, version)
+    t1 = perf_counter()
+    if not write:
+        return files, {"render": t1 - t0, "write": 0.0}
+    for filename in files:
+        path = os.path.join(outputPath, filename)
+        if overwrite:
+            # a class rendered again often gives the same text, its files keep their modification time then
+            output.write_if_changed(path, files[filename])
+        else:
+            output.write_file(path, files[filename])
+    return list(files), {"render": t1 - t0, "write": perf_counter() - t1}
 
 
 def get_rid_of_hash(name):
@@ -521,8 +879,6 @@ def format_class(_range, _dataType):
 
 
 def _write_files(class_details, outputPath, version):
-    class_details["langPack"].setup(outputPath, package_listed_by_short_name)
-
     if class_details["sub_class_of"] == None:
         # If class has no subClassOf key it is a subclass of the Base class
         class_details["sub_class_of"] = class_details["langPack"].base["base_class"]
@@ -534,18 +890,24 @@ def _write_files(class_details, outputPath, version):
         # If class is a subclass a super().__init__() is needed
         class_details["super_init"] = True
 
+    _complete_attributes(class_details["attributes"])
+    for super_class in class_details.get("inherited_attributes", []):
+        _complete_attributes(super_class["attributes"])
+
+    return class_details["langPack"].run_template(outputPath, class_details)
+
+
+def _complete_attributes(attributes):
     # The entry dataType for an attribute is only set for basic data types. If the entry is not set here, the attribute
     # is a reference to another class and therefore the entry dataType is generated and set to the multiplicity
-    for i in range(len(class_details["attributes"])):
+    for i in range(len(attributes)):
         if (
-            "dataType" not in class_details["attributes"][i].keys()
-            and "multiplicity" in class_details["attributes"][i].keys()
+            "dataType" not in attributes[i].keys()
+            and "multiplicity" in attributes[i].keys()
         ):
-            class_details["attributes"][i]["dataType"] = class_details["attributes"][i][
-                "multiplicity"
-            ]
+            attributes[i]["dataType"] = attributes[i]["multiplicity"]
 
-    for attr in class_details["attributes"]:
+    for attr in attributes:
         _range = ""
         _dataType = ""
         if "range" in attr:
@@ -554,19 +916,18 @@ def _write_files(class_details, outputPath, version):
             _dataType = attr["dataType"]
         attr["class_name"] = format_class(_range, _dataType)
 
-    class_details["langPack"].run_template(outputPath, class_details)
+
+def _copy_dicts(dicts):
+    return [dict(d) for d in dicts]
 
 
 # Find multiple entries for the same attribute
 def _find_multiple_attributes(attributes_array):
     merged_attributes = []
+    labels = set()
     for elem in attributes_array:
-        found = False
-        for i in range(len(merged_attributes)):
-            if elem["label"] == merged_attributes[i]["label"]:
-                found = True
-                break
-        if found is False:
+        if elem["label"] not in labels:
+            labels.add(elem["label"])
             merged_attributes.append(elem)
     return merged_attributes
 
@@ -605,9 +966,15 @@ def _merge_profiles(profiles_array):
 
 # This function merges the classes defined in all profiles into one class with all attributes defined in any profile.
 # The origin of the class definitions and the origin of the attributes of a class are tracked and used to generate
-# the possibleProfileList used for the serialization.
-def _merge_classes(profiles_dict):
+# the possibleProfileList used for the serialization. Every profile gets a bit in profile_bits, in the order in which
+# the profiles are merged, and the profile_mask of each class and attribute has the bits of its origins set. As the
+# origins are added in the same order, the bits of a mask are in the order of its origin list.
+def _merge_classes(profiles_dict, short_package_name, profile_bits=None):
+    if profile_bits is None:
+        profile_bits = {}
     class_dict = {}
+    # origin names of the attributes in class_dict, by class and attribute label
+    attr_origin_names = {}
 
     # Iterate over profiles
     for package_key in profiles_dict.keys():
@@ -617,6 +984,9 @@ def _merge_classes(profiles_dict):
             short_name = short_package_name[package_key]
         else:
             short_name = package_key
+        if short_name not in profile_bits:
+            profile_bits[short_name] = 1 << len(profile_bits)
+        bit = profile_bits[short_name]
 
         # iterate over classes in the current profile
         for class_key in profiles_dict[package_key]:
@@ -625,9 +995,12 @@ def _merge_classes(profiles_dict):
                 # store class and class origin
                 class_dict[class_key] = profiles_dict[package_key][class_key]
                 class_dict[class_key].addOrigin({"origin": short_name})
+                class_dict[class_key].profile_mask |= bit
                 for attr in class_dict[class_key].attributes():
                     # store origin of the attributes
                     attr["attr_origin"] = [{"origin": short_name}]
+                    attr["profile_mask"] = bit
+                    attr_origin_names[(class_key, attr["label"])] = {short_name}
             else:
                 # some inheritance information is stored only in one of the packages. Therefore it has to be checked
                 # if the subClassOf attribute is set. See for example TopologicalNode definitions in SV and TP.
@@ -638,111 +1011,495 @@ def _merge_classes(profiles_dict):
                         ].superClass()
 
                 # check if profile is already stored in class origin list
-                multiple_origin = False
-                for origin in class_dict[class_key].origins():
-                    if short_name == origin["origin"]:
-                        # origin already stored
-                        multiple_origin = True
-                        break
-                if not multiple_origin:
+                if not class_dict[class_key].hasOrigin(short_name):
                     class_dict[class_key].addOrigin({"origin": short_name})
+                    class_dict[class_key].profile_mask |= bit
 
                 for attr in profiles_dict[package_key][class_key].attributes():
                     # check if attribute is already in attributes list
-                    multiple_attr = False
-                    for attr_set in class_dict[class_key].attributes():
-                        if attr["label"] == attr_set["label"]:
-                            # attribute already in attributes list, check if origin is new
-                            multiple_attr = True
-                            for origin in attr_set["attr_origin"]:
-                                multiple_attr_origin = False
-                                if origin["origin"] == short_name:
-                                    multiple_attr_origin = True
-                                    break
-                            if not multiple_attr_origin:
-                                # new origin
-                                attr_set["attr_origin"].append({"origin": short_name})
-                            break
-                    if not multiple_attr:
+                    attr_set = class_dict[class_key].attribute(attr["label"])
+                    if attr_set is not None:
+                        # attribute already in attributes list, check if origin is new
+                        origin_names = attr_origin_names[(class_key, attr["label"])]
+                        if short_name not in origin_names:
+                            # new origin
+                            origin_names.add(short_name)
+                            attr_set["attr_origin"].append({"origin": short_name})
+                            attr_set["profile_mask"] |= bit
+                    else:
                         # new attribute
                         attr["attr_origin"] = [{"origin": short_name}]
+                        attr["profile_mask"] = bit
+                        attr_origin_names[(class_key, attr["label"])] = {short_name}
                         class_dict[class_key].addAttribute(attr)
     return class_dict
 
 
-def recursivelyAddSubClasses(class_dict, class_name):
-    newSubClasses = []
-    theClass = class_dict[class_name]
-    for name in theClass.subClasses():
-        newSubClasses.append(name)
-        newNewSubClasses = recursivelyAddSubClasses(class_dict, name)
-        newSubClasses = newSubClasses + newNewSubClasses
-    return newSubClasses
+# Calls function for the elements of the iterables, in the worker processes of executor if there is one. The results
+# are returned as a list in the order of the iterables.
+def _map(executor, function, *iterables, chunksize=1):
+    if executor is None:
+        return list(map(function, *iterables))
+    return list(executor.map(function, *iterables, chunksize=chunksize))
+
+
+# Raised for unknown profiles or root classes, before any file is written
+class SelectionError(ValueError):
+    pass
+
+
+# Returns the classes of class_dict which are needed to generate a subset of the classes: the classes defined in one of
+# the profiles (given by their short names) and the root classes, together with all classes they depend on through
+# their superclass, the ranges and the data types of their attributes. The attributes which are only defined in other
+# profiles are left out of the classes defined in one of the profiles, so they do not add dependencies. Classes which
+# are only needed as dependency keep all their attributes, e.g. value, unit and multiplier of a float class.
+def _select_classes(class_dict, short_package_name, profiles=None, root_classes=None):
+    roots = []
+    if profiles is not None:
+        unknown = set(profiles) - set(short_package_name.values())
+        if unknown:
+            raise SelectionError(
+                "Unknown profiles {}, the schema has {}".format(
+                    sorted(unknown), sorted(set(short_package_name.values()))
+                )
+            )
+        for class_name, class_definition in class_dict.items():
+            if any(class_definition.hasOrigin(profile) for profile in profiles):
+                roots.append(class_name)
+                attributes = []
+                for attribute in class_definition.attributes():
+                    for origin in attribute["attr_origin"]:
+                        if origin["origin"] in profiles:
+                            attributes.append(attribute)
+                            break
+                class_definition.setAttributes(attributes)
+    if root_classes is not None:
+        unknown = set(root_classes) - set(class_dict)
+        if unknown:
+            raise SelectionError("Unknown root classes {}".format(sorted(unknown)))
+        roots.extend(root_classes)
+
+    selected = set()
+    pending = list(roots)
+    while pending:
+        class_name = pending.pop()
+        if class_name in selected or class_name not in class_dict:
+            continue
+        selected.add(class_name)
+        class_definition = class_dict[class_name]
+        if class_definition.superClass() is not None:
+            pending.append(class_definition.superClass())
+        for attribute in class_definition.attributes():
+            for key in ("range", "dataType"):
+                if key in attribute:
+                    pending.append(get_rid_of_hash(attribute[key]))
+    return {name: class_dict[name] for name in class_dict if name in selected}
+
+
+# Returns all subclasses of a class, each direct subclass followed by its own subclasses. The result for every class
+# is stored in closure, so each part of the hierarchy is only walked once.
+def _subclass_closure(class_dict, class_name, closure):
+    if class_name not in closure:
+        subclasses = []
+        for name in class_dict[class_name].subClasses():
+            subclasses.append(name)
+            subclasses.extend(_subclass_closure(class_dict, name, closure))
+        closure[class_name] = subclasses
+    return closure[class_name]
+
+
+# Returns all superclasses of a class which are part of the model, the direct superclass first.
+def _superclass_closure(class_dict, class_name, closure):
+    if class_name not in closure:
+        super_name = class_dict[class_name].superClass()
+        if super_name in class_dict:
+            closure[class_name] = [super_name] + _superclass_closure(
+                class_dict, super_name, closure
+            )
+        else:
+            closure[class_name] = []
+    return closure[class_name]
+
+
+# Stores the transitive closure of the inheritance relation in the classes: after this function subClasses() returns
+# all descendants and superClasses() all ancestors of a class. The tables are part of the class details of every
+# langPack as sub_classes and super_classes, see hierarchy_details.
+def _add_inheritance_tables(class_dict):
+    # work out the direct subclasses for each class by noting the reverse relationship
+    for className in class_dict:
+        superClassName = class_dict[className].superClass()
+        if superClassName != None:
+            if superClassName in class_dict:
+                superClass = class_dict[superClassName]
+                superClass.addSubClass(className)
+            else:
+                print("No match for superClass in dict: :", superClassName)
 
+    subclass_closure = {}
+    superclass_closure = {}
+    for className in class_dict:
+        _subclass_closure(class_dict, className, subclass_closure)
+        _superclass_closure(class_dict, className, superclass_closure)
 
-def addSubClassesOfSubClasses(class_dict):
+    # the direct subclasses are needed until all closures are computed
     for className in class_dict:
-        class_dict[className].setSubClasses(
-            recursivelyAddSubClasses(class_dict, className)
+        class_dict[className].setSubClasses(subclass_closure[className])
+        class_dict[className].setSuperClasses(superclass_closure[className])
+
+
+# Generates the classes of schema directories. The options shared by all generations, and the worker processes if jobs
+# is greater than 1, belong to the generator, everything else to the GenerationContext of a generation. So generate
+# can be called from several threads at once, e.g. by a service which handles concurrent requests with a thread pool.
+class Generator:
+    def __init__(
+        self,
+        parser="iterparse",
+        jobs=1,
+        cache_dir=None,
+        cache_size=parse_cache.default_max_size,
+        executor=None,
+    ):
+        """
+        :param executor: concurrent.futures executor to use instead of starting jobs worker processes
+        The other parameters are the ones of cim_generate.
+        """
+        self.parser = parser
+        self.jobs = jobs
+        self.cache_dir = cache_dir
+        self.cache_size = cache_size
+        self._executor = executor
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def executor(self):
+        """Returns the executor, the worker processes are started on first use. None if there are no workers."""
+        if self._executor is None and self.jobs > 1:
+            with self._lock:
+                if self._executor is None:
+                    # The pool is often created by one of several generations running in threads. Forked workers
+                    # could inherit locks held by another thread, e.g. of the template cache or of logging, so the
+                    # workers are started as new processes.
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.jobs,
+                        mp_context=multiprocessing.get_context("spawn"),
+                    )
+                    self._executor = self._pool
+        return self._executor
+
+    def close(self):
+        """Shuts down the worker processes started by the generator"""
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+                self._executor = None
+
+    def context(
+        self, version, incremental=False, run_report=None, langpack_options=None
+    ):
+        return GenerationContext(
+            version,
+            self.parser,
+            self.executor(),
+            incremental,
+            self.cache_dir,
+            self.cache_size,
+            run_report,
+            langpack_options,
         )
 
+    def generate(
+        self,
+        directory,
+        outputPath,
+        version,
+        langPack,
+        incremental=False,
+        run_report=None,
+        profiles=None,
+        root_classes=None,
+        langpack_options=None,
+    ):
+        """Generates the classes of the schema files in directory, see cim_generate for the parameters
+
+        :return: the run report, a new one if none was passed
+        """
+        if isinstance(langPack, (list, tuple)):
+            langPacks = list(langPack)
+            outputPaths = list(outputPath)
+            if len(langPacks) != len(outputPaths):
+                raise ValueError("one outputPath is needed for every langPack")
+        else:
+            langPacks = [langPack]
+            outputPaths = [outputPath]
+        for path in outputPaths:
+            if incremental and not isinstance(output.as_output(path), output.Directory):
+                raise ValueError("incremental generation needs an output directory")
+        context = self.context(version, incremental, run_report, langpack_options)
+        run_report = context.run_report
+        run_report.info.update(
+            {
+                "version": version,
+                "langPack": ", ".join(langPack.__name__ for langPack in langPacks),
+                "jobs": self.jobs,
+            }
+        )
 
-def cim_generate(directory, outputPath, version, langPack):
+        t0 = time()
+
+        # iterate over files in the directory and check if they are RDF files
+        file_paths = []
+        for file in os.listdir(directory):
+            if file.endswith(".rdf"):
+                file_paths.append(os.path.join(directory, file))
+
+        # the files are independent of each other until they are merged, so they can be parsed in parallel. The results
+        # are returned in the order of file_paths, independent of which worker finishes first.
+        with run_report.stage("parse"):
+            parsed_files = _map(
+                context.executor,
+                _parse_file,
+                file_paths,
+                repeat(version),
+                repeat(context.parser),
+                repeat(context.cache_dir),
+            )
+            if context.cache_dir is not None:
+                parse_cache.evict(context.cache_dir, context.cache_size)
+        run_report.count("files", len(file_paths))
+
+        profiles_array = []
+        for parsed, timings in parsed_files:
+            context.add_profile(parsed)
+            profiles_array.append(parsed["classes"])
+            run_report.add_phases(timings)
+            if "read" not in timings:
+                run_report.count("cached_files")
+
+        # merge multiple profile definitions into one profile
+        with run_report.stage("merge_profiles"):
+            profiles_dict = _merge_profiles(profiles_array)
+        run_report.count("profiles", len(profiles_dict))
+
+        # merge classes from different profiles into one class and track origin of the classes and their attributes
+        with run_report.stage("merge_classes"):
+            class_dict_with_origins = _merge_classes(
+                profiles_dict, context.short_package_name, context.profile_bits
+            )
+
+        # only generate the classes needed for the selected profiles and root classes
+        if profiles is not None or root_classes is not None:
+            with run_report.stage("select"):
+                class_dict_with_origins = _select_classes(
+                    class_dict_with_origins,
+                    context.short_package_name,
+                    profiles,
+                    root_classes,
+                )
+            run_report.count("selected_classes", len(class_dict_with_origins))
+
+        # work out the subclasses and superclasses of each class
+        with run_report.stage("subclass_closure"):
+            _add_inheritance_tables(class_dict_with_origins)
+
+        # the class model is counted once, the counters of the langPacks (e.g. written_files) add up over all of them
+        run_report.count("classes", len(class_dict_with_origins))
+        for class_definition in class_dict_with_origins.values():
+            attributes = _find_multiple_attributes(class_definition.attributes())
+            run_report.count("attributes", len(attributes))
+            run_report.count("instances", len(class_definition.instances()))
+
+        # get information for writing python files and write python files. Every langPack renders the classes of the
+        # shared class model with all worker processes.
+        for langPack, outputPath in zip(langPacks, outputPaths):
+            with run_report.stage("emit"):
+                _write_python_files(
+                    class_dict_with_origins, langPack, outputPath, context
+                )
+
+        logger.info("Elapsed Time: {}s\n\n".format(time() - t0))
+        return run_report
+
+    def generate_files(
+        self,
+        directory,
+        version,
+        langPack,
+        run_report=None,
+        profiles=None,
+        root_classes=None,
+        langpack_options=None,
+    ):
+        """Generates the classes like generate, but returns the files instead of writing them, see cim_generate_files"""
+        target = output.Memory()
+        run_report = self.generate(
+            directory,
+            target,
+            version,
+            langPack,
+            run_report=run_report,
+            profiles=profiles,
+            root_classes=root_classes,
+            langpack_options=langpack_options,
+        )
+        with run_report.stage("resolve_headers"):
+            langPack.resolve_headers(target)
+        return target.files()
+
+
+def cim_generate(
+    directory,
+    outputPath,
+    version,
+    langPack,
+    parser="iterparse",
+    jobs=1,
+    incremental=False,
+    cache_dir=None,
+    cache_size=parse_cache.default_max_size,
+    run_report=None,
+    executor=None,
+    profiles=None,
+    root_classes=None,
+    langpack_options=None,
+):
     """Generates cgmes python classes from cgmes ontology
 
-    This function uses package xmltodict to parse the RDF files. The parse_rdf function sorts the classes to
+    This function streams the rdf:Description elements of the RDF files through iterparse (or, if requested, parses
+    them as a whole with package xmltodict). The parse_rdf function sorts the classes to
     the corresponding packages. Since multiple files can be read, e.g. Equipment Core and Equipment Short Circuit, the
     classes of these profiles are merged into one profile with the merge_profiles function. After that the merge_classes
     function merges classes defined in multiple profiles into one class and tracks the origin of the class and their
-    attributes. This information is stored in the class variable possibleProfileList and used for serialization.
+    attributes. This information is stored as profile bitmasks in the profile metadata module of the generated package,
+    the class variable possibleProfileList is looked up there and used for serialization.
     For more information see the cimexport function in the cimpy package. Finally the
     write_python_files function extracts all information needed for the creation of the python files and creates them
     with the template engine chevron. The attribute version of this function defines the name of the folder where the
     created classes are stored. This folder should not exist and is created in the class generation procedure.
 
     :param directory: path to RDF files containing cgmes ontology, e.g. directory = "./examples/cgmes_schema/cgmes_v2_4_15_schema"
-    :param outputPath: CGMES version, e.g. version = "cgmes_v2_4_15"
-    :param langPack:   python module containing language specific functions
+    :param outputPath: output directory, or an output target (see output.py), e.g. an archive opened with
+                       output.open_output("classes.zip"), which has to be closed after resolve_headers. A list of them
+                       if langPack is a list.
+    :param langPack:   python module containing language specific functions, or a list of them to generate several
+                       languages from one parse, each into the output at the same position in outputPath
+    :param parser:     "iterparse" to stream the RDF files, "xmltodict" to read each file into one dictionary
+    :param jobs:       number of worker processes used to parse the RDF files and to render the classes
+    :param incremental: only render the classes which changed since the last run, see output.py
+    :param cache_dir:  directory of the parse cache, see parse_cache.py, the RDF files are always parsed if it is None
+    :param cache_size: maximum size of the parse cache in bytes
+    :param run_report: report.RunReport which records the timings and counters of the run, e.g. to pass a callback
+    :param executor:   concurrent.futures executor to use instead of starting jobs worker processes, e.g. to share
+                       them between several calls. A long running process can also keep a Generator instead.
+    :param profiles:   short names of the profiles to generate the classes of, e.g. ["EQ", "SSH", "TP", "SV"]. The
+                       attributes of other profiles are left out. All profiles if it is None.
+    :param root_classes: names of classes to generate. With profiles the classes of the profiles are generated too.
+                       The classes they depend on through their superclass and the ranges and data types of their
+                       attributes are always generated as well.
+    :param langpack_options: output options of the langPacks, {name: value}, see the options dict of a langPack
+    :return:           the run_report, a new one if none was passed
     """
-    profiles_array = []
-
-    t0 = time()
-
-    # iterate over files in the directory and check if they are RDF files
-    for file in os.listdir(directory):
-        if file.endswith(".rdf"):
-            logger.info('Start of parsing file "%s"', file)
-
-            file_path = os.path.join(directory, file)
-            xmlstring = open(file_path, encoding="utf8").read()
-
-            # parse RDF files and create a dictionary from the RDF file
-            parse_result = xmltodict.parse(
-                xmlstring, attr_prefix="$", cdata_key="_", dict_constructor=dict
-            )
-            parsed = _parse_rdf(parse_result, version)
-            profiles_array.append(parsed)
-
-    # merge multiple profile definitions into one profile
-    profiles_dict = _merge_profiles(profiles_array)
-
-    # merge classes from different profiles into one class and track origin of the classes and their attributes
-    class_dict_with_origins = _merge_classes(profiles_dict)
-
-    # work out the subclasses for each class by noting the reverse relationship
-    for className in class_dict_with_origins:
-        superClassName = class_dict_with_origins[className].superClass()
-        if superClassName != None:
-            if superClassName in class_dict_with_origins:
-                superClass = class_dict_with_origins[superClassName]
-                superClass.addSubClass(className)
-            else:
-                print("No match for superClass in dict: :", superClassName)
-
-    # recursively add the subclasses of subclasses
-    addSubClassesOfSubClasses(class_dict_with_origins)
+    with Generator(parser, jobs, cache_dir, cache_size, executor) as generator:
+        return generator.generate(
+            directory,
+            outputPath,
+            version,
+            langPack,
+            incremental,
+            run_report,
+            profiles,
+            root_classes,
+            langpack_options,
+        )
 
-    # get information for writing python files and write python files
-    _write_python_files(class_dict_with_origins, langPack, outputPath, version)
 
-    logger.info("Elapsed Time: {}s\n\n".format(time() - t0))
+def cim_generate_batch(
+    runs,
+    parser="iterparse",
+    jobs=1,
+    incremental=False,
+    cache_dir=None,
+    cache_size=parse_cache.default_max_size,
+    run_reports=None,
+    profiles=None,
+    root_classes=None,
+    langpack_options=None,
+):
+    """Generates several schema versions concurrently in this process
+
+    Every run is generated in its own thread by one Generator, with its own GenerationContext, so the runs do not
+    interfere. The worker processes, and with them the template caches of the workers, are shared by all runs; without
+    worker processes the runs share the template cache of this process.
+
+    :param runs:        list of (directory, outputPath, version, langPack) tuples, the arguments of cim_generate
+    :param jobs:        number of worker processes shared by all runs
+    :param run_reports: list with a report.RunReport for every run
+    :return:            list of the run reports, in the order of runs
+    The other parameters are the ones of cim_generate and apply to all runs.
+    """
+    if run_reports is None:
+        run_reports = [report.RunReport() for run in runs]
+    with Generator(parser, jobs, cache_dir, cache_size) as generator:
+        with ThreadPoolExecutor(max_workers=max(1, len(runs))) as threads:
+            futures = []
+            for (directory, outputPath, version, langPack), run_report in zip(
+                runs, run_reports
+            ):
+                futures.append(
+                    threads.submit(
+                        generator.generate,
+                        directory,
+                        outputPath,
+                        version,
+                        langPack,
+                        incremental,
+                        run_report,
+                        profiles,
+                        root_classes,
+                        langpack_options,
+                    )
+                )
+            return [future.result() for future in futures]
+
+
+def cim_generate_files(
+    directory,
+    version,
+    langPack,
+    parser="iterparse",
+    jobs=1,
+    cache_dir=None,
+    cache_size=parse_cache.default_max_size,
+    run_report=None,
+    profiles=None,
+    root_classes=None,
+    langpack_options=None,
+):
+    """Generates the classes like cim_generate, but returns the files instead of writing them
+
+    Nothing is written to the filesystem, except for the parse cache if cache_dir is set. The files derived from the
+    generated classes by langPack.finalize and langPack.resolve_headers, e.g. CIMClassList.hpp or the python
+    __init__.py, are included.
+
+    :param directory:  path to RDF files containing cgmes ontology
+    :param version:    CGMES version, e.g. version = "cgmes_v2_4_15"
+    :param langPack:   python module containing language specific functions
+    :return:           {relative path: file content as UTF-8 encoded bytes}, in the order of the paths
+    The other parameters are the ones of cim_generate.
+    """
+    with Generator(parser, jobs, cache_dir, cache_size) as generator:
+        return generator.generate_files(
+            directory,
+            version,
+            langPack,
+            run_report,
+            profiles,
+            root_classes,
+            langpack_options,
+        )
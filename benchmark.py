@@ -0,0 +1,266 @@
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import importlib
+import subprocess
+
+# Benchmark of the complete generation for every schema directory in
+# cgmes_schema and every langPack. Each generation runs in a separate process,
+# so that the peak RSS belongs to this generation only. The results can be
+# stored as baseline and later runs compared against it: a stage which got
+# slower, or a peak RSS which grew, by more than the threshold is reported as
+# regression and the benchmark exits with status 1.
+
+languages = ["cpp", "java", "javascript", "python"]
+
+parser = argparse.ArgumentParser(
+    description="Benchmark the generation of the CIM classes."
+)
+parser.add_argument(
+    "--schemadir",
+    type=str,
+    default="cgmes_schema",
+    help="Directory containing one directory of schema files per CGMES version",
+)
+parser.add_argument(
+    "--langdir",
+    type=str,
+    nargs="+",
+    choices=languages,
+    default=languages,
+    help="The langpacks to benchmark, defaults to all",
+)
+parser.add_argument(
+    "--jobs",
+    type=int,
+    default=1,
+    help="Number of worker processes used by each generation",
+)
+parser.add_argument(
+    "--repeat",
+    type=int,
+    default=1,
+    help="Number of generations per schema and langpack, the fastest one is reported",
+)
+parser.add_argument("--output", type=str, help="Write the results to this JSON file")
+parser.add_argument(
+    "--baseline", type=str, help="Compare the results with this JSON file"
+)
+parser.add_argument(
+    "--threshold",
+    type=float,
+    default=0.25,
+    help="Relative increase of a stage time or the peak RSS which is a regression, defaults to 0.25",
+)
+parser.add_argument(
+    "--min-delta",
+    type=float,
+    default=0.05,
+    help="Time differences below this number of seconds are never a regression, defaults to 0.05",
+)
+# used by the benchmark to run a single generation in a child process
+parser.add_argument("--run-one", nargs=3, help=argparse.SUPPRESS)
+
+
+# The schemas of all 2.4 versions, e.g. "CGMES_2.4.13_18DEC2013", are generated
+# as version "cgmes_v2_4_15", the only 2.4 version CIMgen supports
+def cgmes_version(schema_name):
+    if schema_name.split("_")[1].startswith("2.4."):
+        return "cgmes_v2_4_15"
+    return "cgmes_v" + schema_name.split("_")[1].replace(".", "_")
+
+
+def _peak_rss_kib():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    # ru_maxrss is in bytes on macOS and in KiB everywhere else
+    if sys.platform == "darwin":
+        peak //= 1024
+    return peak
+
+
+def _output_size(directory):
+    files = 0
+    size = 0
+    for root, dirs, filenames in os.walk(directory):
+        for filename in filenames:
+            files += 1
+            size += os.path.getsize(os.path.join(root, filename))
+    return files, size
+
+
+# Runs one generation in this process and returns its measurements
+def run_one(schema_path, language, jobs):
+    import CIMgen
+    import report
+
+    langPack = importlib.import_module(language + ".langPack")
+    outdir = tempfile.mkdtemp(prefix="cimgen-benchmark-")
+    run_report = report.RunReport()
+    try:
+        CIMgen.cim_generate(
+            schema_path,
+            outdir,
+            cgmes_version(os.path.basename(schema_path)),
+            langPack,
+            jobs=jobs,
+            run_report=run_report,
+        )
+        with run_report.stage("resolve_headers"):
+            langPack.resolve_headers(outdir)
+        files, size = _output_size(outdir)
+    finally:
+        shutil.rmtree(outdir)
+    return {
+        "stages": run_report.as_dict()["stages"],
+        "peak_rss_kib": _peak_rss_kib(),
+        "output_files": files,
+        "output_bytes": size,
+    }
+
+
+# Runs one generation in a child process, returns its measurements or the error
+def _run_child(schema_path, language, jobs):
+    process = subprocess.run(
+        [sys.executable, __file__, "--run-one", schema_path, language, str(jobs)],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    if process.returncode != 0:
+        lines = process.stderr.strip().splitlines()
+        return {"error": lines[-1] if lines else "exit status %d" % process.returncode}
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+
+# Keeps the fastest stage times and the smallest peak RSS of the repetitions
+def _best_of(results):
+    for result in results:
+        if "error" in result:
+            return result
+    best = results[0]
+    for result in results[1:]:
+        for stage in result["stages"]:
+            best["stages"][stage] = min(best["stages"][stage], result["stages"][stage])
+        if result["peak_rss_kib"] is not None:
+            best["peak_rss_kib"] = min(best["peak_rss_kib"], result["peak_rss_kib"])
+    return best
+
+
+def run(schemadir, languages, jobs, repeat):
+    results = {}
+    for schema_name in sorted(os.listdir(schemadir)):
+        schema_path = os.path.abspath(os.path.join(schemadir, schema_name))
+        if not os.path.isdir(schema_path):
+            continue
+        for language in languages:
+            name = schema_name + "/" + language
+            print("Benchmarking " + name, file=sys.stderr)
+            results[name] = _best_of(
+                [_run_child(schema_path, language, jobs) for _ in range(repeat)]
+            )
+    return results
+
+
+# Returns the regressions of results compared to baseline as list of messages
+def compare(results, baseline, threshold, min_delta):
+    regressions = []
+    for name in sorted(results):
+        result = results[name]
+        if name not in baseline:
+            continue
+        base = baseline[name]
+        if "error" in result:
+            if "error" not in base:
+                regressions.append("{}: failed, {}".format(name, result["error"]))
+            continue
+        if "error" in base:
+            continue
+        for stage in sorted(result["stages"]):
+            if stage not in base["stages"]:
+                continue
+            new = result["stages"][stage]
+            old = base["stages"][stage]
+            if new - old > min_delta and new > old * (1 + threshold):
+                regressions.append(
+                    "{}: {} took {:.3f}s instead of {:.3f}s".format(
+                        name, stage, new, old
+                    )
+                )
+        new = result["peak_rss_kib"]
+        old = base["peak_rss_kib"]
+        if new is not None and old is not None and new > old * (1 + threshold):
+            regressions.append(
+                "{}: peak RSS {} KiB instead of {} KiB".format(name, new, old)
+            )
+    return regressions
+
+
+def print_results(results):
+    print(
+        "{:40} {:>8} {:>8} {:>8} {:>8} {:>8} {:>10} {:>12}".format(
+            "schema/langpack",
+            "parse",
+            "merge",
+            "emit",
+            "headers",
+            "total",
+            "RSS KiB",
+            "bytes",
+        )
+    )
+    for name in sorted(results):
+        result = results[name]
+        if "error" in result:
+            print("{:40} {}".format(name, result["error"]))
+            continue
+        stages = result["stages"]
+        print(
+            "{:40} {:8.3f} {:8.3f} {:8.3f} {:8.3f} {:8.3f} {:>10} {:>12}".format(
+                name,
+                stages["parse"],
+                stages["merge_profiles"]
+                + stages["merge_classes"]
+                + stages["subclass_closure"],
+                stages["emit"],
+                stages["resolve_headers"],
+                stages["total"],
+                str(result["peak_rss_kib"]),
+                result["output_bytes"],
+            )
+        )
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    if args.run_one:
+        schema_path, language, jobs = args.run_one
+        print(json.dumps(run_one(schema_path, language, int(jobs))))
+        sys.exit(0)
+
+    results = run(args.schemadir, args.langdir, args.jobs, args.repeat)
+    print_results(results)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold, args.min_delta)
+        for regression in regressions:
+            print("Regression: " + regression)
+        if regressions:
+            sys.exit(1)
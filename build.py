@@ -1,23 +1,205 @@
 import CIMgen
+import output
+import report
 import os
+import json
 import argparse
 import importlib
+from contextlib import ExitStack
 
 parser = argparse.ArgumentParser(description="Generate some CIM classes.")
-parser.add_argument("--outdir", type=str, help="The output directory", required=True)
-parser.add_argument("--schemadir", type=str, help="The schema directory", required=True)
-parser.add_argument("--langdir", type=str, help="The langpack directory", required=True)
+parser.add_argument(
+    "--outdir",
+    type=str,
+    help="The output directory, or an archive file ending with .zip, .tar or .tar.zst. "
+    "With several schema directories each one is written into a subdirectory named after it, "
+    "with several langpacks each one is written into a subdirectory named after the langpack.",
+    required=True,
+)
+parser.add_argument(
+    "--schemadir",
+    type=str,
+    nargs="+",
+    help="The schema directory, or several of them to generate them concurrently",
+    required=True,
+)
+parser.add_argument(
+    "--langdir",
+    type=str,
+    nargs="+",
+    help="The langpack directory, or several of them to generate them from one parse",
+    required=True,
+)
 parser.add_argument(
     "--cgmes_version",
     type=str,
+    nargs="+",
     choices=["cgmes_v2_4_13", "cgmes_v2_4_15", "cgmes_v3_0_0"],
-    default="cgmes_v2_4_15",
-    help="CGMES Version",
+    default=["cgmes_v2_4_15"],
+    help="CGMES Version, one for all schema directories or one for each of them",
 )
-args = parser.parse_args()
+parser.add_argument(
+    "--parser",
+    type=str,
+    choices=list(CIMgen.parsers),
+    default="iterparse",
+    help="RDF parser, iterparse streams the schema files description by description",
+)
+parser.add_argument(
+    "--jobs",
+    type=int,
+    default=1,
+    help="Number of worker processes, defaults to 1 (no worker processes)",
+)
+parser.add_argument(
+    "--incremental",
+    action="store_true",
+    help="Only regenerate the classes which changed since the last run into outdir",
+)
+
+parser.add_argument(
+    "--profiles",
+    type=str,
+    nargs="+",
+    default=None,
+    help="Only generate the classes of these profiles, given by their short names, e.g. EQ SSH TP SV",
+)
+parser.add_argument(
+    "--root-classes",
+    type=str,
+    nargs="+",
+    default=None,
+    help="Only generate these classes (and with --profiles the classes of the profiles) "
+    "and the classes they depend on",
+)
+parser.add_argument(
+    "--langpack-option",
+    type=str,
+    action="append",
+    default=[],
+    metavar="NAME[=VALUE]",
+    help="Output option of the langpack, can be given several times, e.g. lazy_docs for python. "
+    "VALUE switches it on (1, true, yes, on) or off (0, false, no, off), without VALUE it is on",
+)
+parser.add_argument(
+    "--parse-cache",
+    type=str,
+    default=None,
+    help="Directory to cache the parsed schema files in, by default they are always parsed",
+)
+parser.add_argument(
+    "--parse-cache-size",
+    type=int,
+    default=CIMgen.parse_cache.default_max_size // (1024 * 1024),
+    help="Maximum size of the parse cache in MiB, least recently used entries are removed",
+)
+parser.add_argument(
+    "--report",
+    type=str,
+    default=None,
+    help="Write the timings and counters of the run as JSON to this file",
+)
+parser.add_argument(
+    "--trace-memory",
+    action="store_true",
+    help="Add the memory allocations of every stage to the report, traced with tracemalloc",
+)
+
+# the values of --langpack-option NAME=VALUE
+switched_on = ("1", "true", "yes", "on")
+switched_off = ("0", "false", "no", "off")
+
+# worker processes may import this module, they must not run the generation again
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    langPacks = []
+    for langdir in args.langdir:
+        langPacks.append(importlib.import_module(langdir + ".langPack"))
+    # the options of the langpacks are switches, options without a value are switched on
+    langpack_options = {}
+    for option in args.langpack_option:
+        name, sep, value = option.partition("=")
+        known = [name in getattr(langPack, "options", {}) for langPack in langPacks]
+        if not any(known):
+            parser.error("no langpack has the option " + name)
+        if not sep:
+            langpack_options[name] = True
+        elif value.lower() in switched_on:
+            langpack_options[name] = True
+        elif value.lower() in switched_off:
+            langpack_options[name] = False
+        else:
+            parser.error(
+                "the value of the option {} must be one of {}".format(
+                    name, ", ".join(switched_on + switched_off)
+                )
+            )
+    versions = args.cgmes_version
+    if len(versions) == 1:
+        versions = versions * len(args.schemadir)
+    elif len(versions) != len(args.schemadir):
+        parser.error("--cgmes_version needs one version or one for every schemadir")
+    several_outputs = len(args.schemadir) > 1 or len(args.langdir) > 1
+    if several_outputs and args.outdir.endswith(output.archive_extensions):
+        parser.error("several outputs need an output directory, not an archive")
+    if args.incremental and args.outdir.endswith(output.archive_extensions):
+        parser.error("--incremental needs an output directory, not an archive")
+    if args.outdir.endswith(".tar.zst") and output.zstandard is None:
+        parser.error(
+            ".tar.zst archives need the zstandard package, install it with the zstd extra"
+        )
+
+    # every schema directory is a run, which generates all langpacks
+    runs = []
+    for schemadir, version in zip(args.schemadir, versions):
+        outdir = args.outdir
+        if len(args.schemadir) > 1:
+            outdir = os.path.join(outdir, os.path.basename(os.path.normpath(schemadir)))
+        if len(args.langdir) > 1:
+            outdirs = [os.path.join(outdir, langdir) for langdir in args.langdir]
+        else:
+            outdirs = [outdir]
+        runs.append((os.path.join(os.getcwd(), schemadir), outdirs, version))
+
+    run_reports = []
+    for run in runs:
+        run_reports.append(report.RunReport(trace_memory=args.trace_memory))
+    with ExitStack() as stack:
+        batch = []
+        for schema_path, outdirs, version in runs:
+            targets = []
+            for outdir in outdirs:
+                targets.append(stack.enter_context(output.open_output(outdir)))
+            batch.append((schema_path, targets, version, langPacks))
+        try:
+            CIMgen.cim_generate_batch(
+                batch,
+                parser=args.parser,
+                jobs=args.jobs,
+                incremental=args.incremental,
+                cache_dir=args.parse_cache,
+                cache_size=args.parse_cache_size * 1024 * 1024,
+                run_reports=run_reports,
+                profiles=args.profiles,
+                root_classes=args.root_classes,
+                langpack_options=langpack_options,
+            )
+        except CIMgen.SelectionError as e:
+            # the names of --profiles and --root-classes are known after parsing
+            parser.error(str(e))
 
-langPack = importlib.import_module(args.langdir + ".langPack")
-schema_path = os.path.join(os.getcwd(), args.schemadir)
-CIMgen.cim_generate(schema_path, args.outdir, args.cgmes_version, langPack)
+        for run, run_report in zip(batch, run_reports):
+            for langPack, target in zip(langPacks, run[1]):
+                with run_report.stage("resolve_headers"):
+                    langPack.resolve_headers(target)
 
-langPack.resolve_headers(args.outdir)
+    if args.report:
+        if len(runs) == 1:
+            run_reports[0].write(args.report)
+        else:
+            reports = {}
+            for schemadir, run_report in zip(args.schemadir, run_reports):
+                reports[schemadir] = run_report.as_dict()
+            with open(args.report, "w") as f:
+                json.dump(reports, f, indent=1)
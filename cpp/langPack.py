@@ -1,6 +1,6 @@
 import os
-import chevron
-import json
+import template_cache
+import output
 
 
 def location(version):
@@ -12,12 +12,13 @@ def location(version):
 # We don't use that here because we aren't exporting into
 # separate profiles.
 def setup(version_path, cgmes_profile_info):
-    if not os.path.exists(version_path):
-        os.makedirs(version_path)
+    output.as_output(version_path).create()
 
 
 base = {"base_class": "BaseClass", "class_location": location}
 
+template_dir = os.path.join(os.path.dirname(__file__), "templates")
+
 # These are the files that are used to generate the header and object files.
 # There is a template set for the large number of classes that are floats. They
 # have unit, multiplier and value attributes in the schema, but only appear in
@@ -40,52 +41,47 @@ def get_class_location(class_name, class_map, version):
     pass
 
 
+# These classes are defined already, no files are generated for them.
+# We have to implement operators for them.
+predefined_classes = ["Integer", "Boolean", "Date"]
+
+
+def _template_files(class_details):
+    if class_details["is_a_float"] == True:
+        return float_template_files
+    elif class_details["has_instances"] == True:
+        return enum_template_files
+    else:
+        return template_files
+
+
 partials = {
-    "attribute": "{{#langPack.attribute_decl}}{{.}}{{/langPack.attribute_decl}}",
+    "attribute": "{{{attribute_decl}}}",
     "label": "{{#langPack.label}}{{label}}{{/langPack.label}}",
     "create_init_list": "{{#langPack.null_init_list}}{{attributes}}{{/langPack.null_init_list}}",
     "create_construct_list": "{{#langPack.create_construct_list}}{{attributes}}{{/langPack.create_construct_list}}",
-    "insert_assign": "{{#langPack.insert_assign_fn}}{{.}}{{/langPack.insert_assign_fn}}",
-    "insert_class_assign": "{{#langPack.insert_class_assign_fn}}{{.}}{{/langPack.insert_class_assign_fn}}",
+    "insert_assign": "{{{insert_assign}}}",
+    "insert_class_assign": "{{{insert_class_assign}}}",
     "read_istream": "{{#langPack.create_istream_op}}{{class_name}} {{label}}{{/langPack.create_istream_op}}",
 }
 
 
-# This is the function that runs the template.
+# This is the function that runs the template. It returns the rendered files
+# by file name, CIMgen writes them into the output directory.
 def run_template(outputPath, class_details):
-    if class_details["is_a_float"] == True:
-        templates = float_template_files
-    elif class_details["has_instances"] == True:
-        templates = enum_template_files
-    else:
-        templates = template_files
-
-    if (
-        class_details["class_name"] == "Integer"
-        or class_details["class_name"] == "Boolean"
-        or class_details["class_name"] == "Date"
-    ):
-        # These classes are defined already
-        # We have to implement operators for them
-        return
-
-    for template_info in templates:
-        class_file = os.path.join(
-            outputPath, class_details["class_name"] + template_info["ext"]
+    _set_attribute_types(class_details)
+    _set_attribute_code(class_details)
+    if class_details["class_name"] in predefined_classes:
+        return {}
+
+    files = {}
+    for template_info in _template_files(class_details):
+        class_file = class_details["class_name"] + template_info["ext"]
+        template_path = os.path.join(template_dir, template_info["filename"])
+        files[class_file] = template_cache.render(
+            template_path, class_details, partials
         )
-        if not os.path.exists(class_file):
-            with open(class_file, "w") as file:
-                template_path = os.path.join(
-                    os.getcwd(), "cpp/templates", template_info["filename"]
-                )
-                with open(template_path) as f:
-                    args = {
-                        "data": class_details,
-                        "template": f,
-                        "partials_dict": partials,
-                    }
-                    output = chevron.render(**args)
-                file.write(output)
+    return files
 
 
 # This function just allows us to avoid declaring a variable called 'switch',
@@ -105,63 +101,63 @@ def label(text, render):
 #    actual class, which will be read from another part of the file.
 #  - attributes with multiplicity of 1..n or 0..n will be std::lists
 #    of pointers to classes read from a different part of the file
-def attribute_type(attribute):
+# We need to know which class types are secretly float primitives or enums,
+# these are read from the file directly into an attribute instead of creating
+# a class. The float and enum classes are part of the class details, so the
+# type is worked out once per attribute before the templates are rendered.
+def _set_attribute_types(class_details):
+    for attribute in class_details["attributes"]:
+        attribute["attribute_type"] = _attribute_type(
+            attribute, class_details["float_classes"], class_details["enum_classes"]
+        )
+
+
+def _attribute_type(attribute, float_classes, enum_classes):
     class_name = attribute["class_name"]
     if attribute["multiplicity"] == "M:0..n" or attribute["multiplicity"] == "M:1..n":
         return "list"
     if (
-        is_a_float_class(class_name)
+        class_name in float_classes
         or class_name == "String"
         or class_name == "Boolean"
         or class_name == "Integer"
-        or is_an_enum_class(class_name)
+        or class_name in enum_classes
     ):
         return "primitive"
     else:
         return "class"
 
 
-# We need to keep track of which class types are secretly float
-# primitives. We will use a different template to create the class
-# definitions, and we will read them from the file directly into
-# an attribute instead of creating a class.
-float_classes = {}
-
-
-def set_float_classes(new_float_classes):
-    for new_class in new_float_classes:
-        float_classes[new_class] = new_float_classes[new_class]
-
-
-def is_a_float_class(name):
-    if name in float_classes:
-        return float_classes[name]
-
-
-enum_classes = {}
-
-
-def set_enum_classes(new_enum_classes):
-    for new_class in new_enum_classes:
-        enum_classes[new_class] = new_enum_classes[new_class]
-
-
-def is_an_enum_class(name):
-    if name in enum_classes:
-        return enum_classes[name]
+def attribute_type(attribute):
+    return attribute["attribute_type"]
+
+
+# The code the templates insert for the attributes is worked out from the
+# attribute dictionaries before the templates are rendered, the templates only
+# insert the results.
+def _set_attribute_code(class_details):
+    attributes = class_details["attributes"]
+    for attribute in attributes:
+        attribute["attribute_decl"] = _attribute_decl(attribute)
+        attribute["insert_assign"] = insert_assign_fn(attribute)
+        attribute["insert_class_assign"] = insert_class_assign_fn(attribute)
+        attribute["create_assign"] = create_assign(attribute)
+        attribute["create_class_assign"] = create_class_assign(attribute)
+    class_details["nullptr_assigns"] = create_nullptr_assigns(attributes)
+    class_details["attribute_includes"] = _create_attribute_includes(attributes)
+    class_details[
+        "attribute_class_declarations"
+    ] = _create_attribute_class_declarations(attributes)
 
 
 # These insert_ functions are used to generate the entries in the dynamic_switch
 # maps, for use in assignments.cpp and Task.cpp
 # TODO: implement this as one function, determine in template if it should be called.
-# TODO: reorganize json object so we don't have to keep doing the same processing.
-def insert_assign_fn(text, render):
-    attribute_txt = render(text)
-    attribute_json = eval(attribute_txt)
-    if not attribute_type(attribute_json) == "primitive":
+def insert_assign_fn(attribute):
+    if not attribute_type(attribute) == "primitive":
         return ""
-    label = attribute_json["label"]
-    class_name = attribute_json["domain"]
+    label = attribute["label"]
+    class_name = attribute["domain"]
     return (
         'assign_map.insert(std::make_pair(std::string("cim:'
         + class_name
@@ -175,13 +171,11 @@ def insert_assign_fn(text, render):
     )
 
 
-def insert_class_assign_fn(text, render):
-    attribute_txt = render(text)
-    attribute_json = eval(attribute_txt)
-    if attribute_type(attribute_json) == "primitive":
+def insert_class_assign_fn(attribute):
+    if attribute_type(attribute) == "primitive":
         return ""
-    label = attribute_json["label"]
-    class_name = attribute_json["domain"]
+    label = attribute["label"]
+    class_name = attribute["domain"]
     return (
         'assign_map.insert(std::make_pair(std::string("cim:'
         + class_name
@@ -204,26 +198,20 @@ def get_dataType_and_range(attribute):
     return (_range, _dataType)
 
 
-def create_nullptr_assigns(text, render):
-    attributes_txt = render(text)
-    if attributes_txt.strip() == "":
-        return ""
-    else:
-        attributes_json = eval(attributes_txt)
-        nullptr_init_string = ": "
-        for attribute in attributes_json:
-            name = attribute["label"]
-            if attribute_type(attribute) == "primitive":
-                continue
-            if (
-                attribute["multiplicity"] == "M:0..n"
-                or attribute["multiplicity"] == "M:1..n"
-            ):
-                continue
-            else:
-                nullptr_init_string += "LABEL(nullptr), ".replace(
-                    "LABEL", attribute["label"]
-                )
+def create_nullptr_assigns(attributes):
+    nullptr_init_string = ": "
+    for attribute in attributes:
+        if attribute_type(attribute) == "primitive":
+            continue
+        if (
+            attribute["multiplicity"] == "M:0..n"
+            or attribute["multiplicity"] == "M:1..n"
+        ):
+            continue
+        else:
+            nullptr_init_string += "LABEL(nullptr), ".replace(
+                "LABEL", attribute["label"]
+            )
 
     if len(nullptr_init_string) > 2:
         return nullptr_init_string[:-2]
@@ -233,17 +221,12 @@ def create_nullptr_assigns(text, render):
 
 # These create_ functions are used to generate the implementations for
 # the entries in the dynamic_switch maps referenced in assignments.cpp and Task.cpp
-def create_class_assign(text, render):
-    attribute_txt = render(text)
-    attribute_json = eval(attribute_txt)
+def create_class_assign(attribute):
     assign = ""
-    attribute_class = attribute_json["class_name"]
-    if attribute_type(attribute_json) == "primitive":
+    attribute_class = attribute["class_name"]
+    if attribute_type(attribute) == "primitive":
         return ""
-    if (
-        attribute_json["multiplicity"] == "M:0..n"
-        or attribute_json["multiplicity"] == "M:1..n"
-    ):
+    if attribute["multiplicity"] == "M:0..n" or attribute["multiplicity"] == "M:1..n":
         assign = (
             """
 bool assign_OBJECT_CLASS_LABEL(BaseClass* BaseClass_ptr1, BaseClass* BaseClass_ptr2) {
@@ -255,17 +238,17 @@ bool assign_OBJECT_CLASS_LABEL(BaseClass* BaseClass_ptr1, BaseClass* BaseClass_p
 	}
 	return false;
 }""".replace(
-                "OBJECT_CLASS", attribute_json["domain"]
+                "OBJECT_CLASS", attribute["domain"]
             )
             .replace("ATTRIBUTE_CLASS", attribute_class)
-            .replace("LABEL", attribute_json["label"])
+            .replace("LABEL", attribute["label"])
         )
     elif (
-        "inverseRole" in attribute_json
-        and "associationUsed" in attribute_json
-        and attribute_json["associationUsed"] != "No"
+        "inverseRole" in attribute
+        and "associationUsed" in attribute
+        and attribute["associationUsed"] != "No"
     ):
-        inverse = attribute_json["inverseRole"].split(".")
+        inverse = attribute["inverseRole"].split(".")
         assign = (
             """
 bool assign_INVERSEC_INVERSEL(BaseClass*, BaseClass*);
@@ -277,10 +260,10 @@ bool assign_OBJECT_CLASS_LABEL(BaseClass* BaseClass_ptr1, BaseClass* BaseClass_p
         }
         return false;
 }""".replace(
-                "OBJECT_CLASS", attribute_json["domain"]
+                "OBJECT_CLASS", attribute["domain"]
             )
             .replace("ATTRIBUTE_CLASS", attribute_class)
-            .replace("LABEL", attribute_json["label"])
+            .replace("LABEL", attribute["label"])
             .replace("INVERSEC", inverse[0])
             .replace("INVERSEL", inverse[1])
         )
@@ -295,23 +278,21 @@ bool assign_OBJECT_CLASS_LABEL(BaseClass* BaseClass_ptr1, BaseClass* BaseClass_p
         }
         return false;
 }""".replace(
-                "OBJECT_CLASS", attribute_json["domain"]
+                "OBJECT_CLASS", attribute["domain"]
             )
             .replace("ATTRIBUTE_CLASS", attribute_class)
-            .replace("LABEL", attribute_json["label"])
+            .replace("LABEL", attribute["label"])
         )
 
     return assign
 
 
-def create_assign(text, render):
-    attribute_txt = render(text)
-    attribute_json = eval(attribute_txt)
+def create_assign(attribute):
     assign = ""
-    _class = attribute_json["class_name"]
-    if not attribute_type(attribute_json) == "primitive":
+    _class = attribute["class_name"]
+    if not attribute_type(attribute) == "primitive":
         return ""
-    label_without_keyword = attribute_json["label"]
+    label_without_keyword = attribute["label"]
     if label_without_keyword == "switch":
         label_without_keyword = "_switch"
 
@@ -329,9 +310,9 @@ bool assign_CLASS_LABEL(std::stringstream &buffer, BaseClass* BaseClass_ptr1) {
         else
                 return false;
 }""".replace(
-                "CLASS", attribute_json["domain"]
+                "CLASS", attribute["domain"]
             )
-            .replace("LABEL", attribute_json["label"])
+            .replace("LABEL", attribute["label"])
             .replace("LBL_WO_KEYWORD", label_without_keyword)
         )
     else:
@@ -346,9 +327,9 @@ bool assign_CLASS_LABEL(std::stringstream &buffer, BaseClass* BaseClass_ptr1) {
 	}
 	return false;
 }""".replace(
-            "CLASS", attribute_json["domain"]
+            "CLASS", attribute["domain"]
         ).replace(
-            "LABEL", attribute_json["label"]
+            "LABEL", attribute["label"]
         )
 
     return assign
@@ -365,12 +346,6 @@ def _get_rid_of_hash(name):
     return name
 
 
-def attribute_decl(text, render):
-    attribute_txt = render(text)
-    attribute_json = eval(attribute_txt)
-    return _attribute_decl(attribute_json)
-
-
 def _attribute_decl(attribute):
     _type = attribute_type(attribute)
     _class = attribute["class_name"]
@@ -382,19 +357,14 @@ def _attribute_decl(attribute):
         return "CIMPP::" + _class + "*"
 
 
-def _create_attribute_includes(text, render):
+def _create_attribute_includes(attributes):
     unique = {}
     include_string = ""
-    inputText = render(text)
-    jsonString = inputText.replace("'", '"')
-    jsonStringNoHtmlEsc = jsonString.replace("&quot;", '"')
-    if jsonStringNoHtmlEsc != None and jsonStringNoHtmlEsc != "":
-        attributes = json.loads(jsonStringNoHtmlEsc)
-        for attribute in attributes:
-            _type = attribute_type(attribute)
-            class_name = attribute["class_name"]
-            if class_name != "" and class_name not in unique:
-                unique[class_name] = _type
+    for attribute in attributes:
+        _type = attribute_type(attribute)
+        class_name = attribute["class_name"]
+        if class_name != "" and class_name not in unique:
+            unique[class_name] = _type
     for clarse in unique:
         if unique[clarse] == "primitive":
             include_string += '\n#include "' + clarse + '.hpp"'
@@ -402,19 +372,14 @@ def _create_attribute_includes(text, render):
     return include_string
 
 
-def _create_attribute_class_declarations(text, render):
+def _create_attribute_class_declarations(attributes):
     unique = {}
     include_string = ""
-    inputText = render(text)
-    jsonString = inputText.replace("'", '"')
-    jsonStringNoHtmlEsc = jsonString.replace("&quot;", '"')
-    if jsonStringNoHtmlEsc != None and jsonStringNoHtmlEsc != "":
-        attributes = json.loads(jsonStringNoHtmlEsc)
-        for attribute in attributes:
-            _type = attribute_type(attribute)
-            class_name = attribute["class_name"]
-            if class_name != "" and class_name not in unique:
-                unique[class_name] = _type
+    for attribute in attributes:
+        _type = attribute_type(attribute)
+        class_name = attribute["class_name"]
+        if class_name != "" and class_name not in unique:
+            unique[class_name] = _type
     for clarse in unique:
         if unique[clarse] == "class" or unique[clarse] == "list":
             include_string += "\nclass " + clarse + ";"
@@ -472,41 +437,50 @@ class_blacklist = [
 iec61970_blacklist = ["CIMClassList", "CIMNamespaces", "Folders", "Task", "IEC61970"]
 
 
-def _is_enum_class(filepath):
-    with open(filepath, encoding="utf-8") as f:
-        try:
-            for line in f:
-                if "enum class" in line:
-                    return True
-        except UnicodeDecodeError as error:
-            print(
-                "Warning: UnicodeDecodeError parsing {0}: {1}".format(filepath, error)
-            )
-    return False
+# The classes which get a header declaring a class, i.e. all generated classes
+# except the enums. They are listed in CIMClassList.hpp and IEC61970.hpp.
+def _declared_class_names(classes):
+    names = []
+    for class_details in classes:
+        if (
+            class_details["class_name"] not in predefined_classes
+            and _template_files(class_details) is not enum_template_files
+        ):
+            names.append(class_details["class_name"])
+    return names
 
 
 def _create_header_include_file(
-    directory, header_include_filename, header, footer, before, after, blacklist
+    directory,
+    class_names,
+    header_include_filename,
+    header,
+    footer,
+    before,
+    after,
+    blacklist,
 ):
     lines = []
 
-    for filename in os.listdir(directory):
-        filepath = os.path.join(directory, filename)
-        basepath, ext = os.path.splitext(filepath)
-        basename = os.path.basename(basepath)
-        if ext == ".hpp" and not _is_enum_class(filepath) and not basename in blacklist:
-            lines.append(before + basename + after)
+    for class_name in class_names:
+        if not class_name in blacklist:
+            lines.append(before + class_name + after)
     lines.sort()
     for line in lines:
         header.append(line)
     for line in footer:
         header.append(line)
-    header_include_filepath = os.path.join(directory, header_include_filename)
-    with open(header_include_filepath, "w", encoding="utf-8") as f:
-        f.writelines(header)
+    # unchanged include files keep their modification time, so that an
+    # incremental run does not trigger a rebuild of everything including them
+    directory.write_if_changed(header_include_filename, "".join(header), "utf-8")
 
 
-def resolve_headers(outputPath):
+# This is called after all classes are rendered, with the class details of all
+# classes. The header include files are built from them instead of reading the
+# generated headers back from the output.
+def finalize(outputPath, classes):
+    outputPath = output.as_output(outputPath)
+    class_names = _declared_class_names(classes)
     class_list_header = [
         "#ifndef CIMCLASSLIST_H\n",
         "#define CIMCLASSLIST_H\n",
@@ -521,6 +495,7 @@ def resolve_headers(outputPath):
 
     _create_header_include_file(
         outputPath,
+        class_names,
         "CIMClassList.hpp",
         class_list_header,
         class_list_footer,
@@ -534,6 +509,7 @@ def resolve_headers(outputPath):
 
     _create_header_include_file(
         outputPath,
+        class_names,
         "IEC61970.hpp",
         iec61970_header,
         iec61970_footer,
@@ -541,3 +517,8 @@ def resolve_headers(outputPath):
         '.hpp"\n',
         iec61970_blacklist,
     )
+
+
+# The header include files are already written by finalize.
+def resolve_headers(outputPath):
+    pass
@@ -1,6 +1,6 @@
 import os
-import chevron
-import json
+import template_cache
+import output
 
 
 def location(version):
@@ -12,12 +12,13 @@ def location(version):
 # We don't use that here because we aren't exporting into
 # separate profiles.
 def setup(version_path, cgmes_profile_info):
-    if not os.path.exists(version_path):
-        os.makedirs(version_path)
+    output.as_output(version_path).create()
 
 
 base = {"base_class": "BaseClass", "class_location": location}
 
+template_dir = os.path.join(os.path.dirname(__file__), "templates")
+
 # These are the files that are used to generate the header and object files.
 # There is a template set for the large number of classes that are floats. They
 # have unit, multiplier and value attributes in the schema, but only appear in
@@ -32,15 +33,18 @@ def get_class_location(class_name, class_map, version):
 
 
 partials = {
-    "attribute": "{{#langPack.attribute_decl}}{{.}}{{/langPack.attribute_decl}}",
+    "attribute": "{{{attribute_decl}}}",
     "label": "{{#langPack.label}}{{label}}{{/langPack.label}}",
-    "insert_assign": "{{#langPack.insert_assign_fn}}{{.}}{{/langPack.insert_assign_fn}}",
-    "insert_class_assign": "{{#langPack.insert_class_assign_fn}}{{.}}{{/langPack.insert_class_assign_fn}}",
+    "insert_assign": "{{{insert_assign}}}",
+    "insert_class_assign": "{{{insert_class_assign}}}",
 }
 
 
-# This is the function that runs the template.
+# This is the function that runs the template. It returns the rendered files
+# by file name, CIMgen writes them into the output directory.
 def run_template(outputPath, class_details):
+    _set_attribute_types(class_details)
+    _set_attribute_code(class_details)
     class_details["primitives"] = []
     for attr in class_details["attributes"]:
         if attribute_type(attr) == "primitive":
@@ -60,25 +64,16 @@ def run_template(outputPath, class_details):
     ):
         # These classes are defined already
         # We have to implement operators for them
-        return
+        return {}
 
+    files = {}
     for template_info in templates:
-        class_file = os.path.join(
-            outputPath, class_details["class_name"] + template_info["ext"]
+        class_file = class_details["class_name"] + template_info["ext"]
+        template_path = os.path.join(template_dir, template_info["filename"])
+        files[class_file] = template_cache.render(
+            template_path, class_details, partials
         )
-        if not os.path.exists(class_file):
-            with open(class_file, "w") as file:
-                template_path = os.path.join(
-                    os.getcwd(), "java/templates", template_info["filename"]
-                )
-                with open(template_path) as f:
-                    args = {
-                        "data": class_details,
-                        "template": f,
-                        "partials_dict": partials,
-                    }
-                    output = chevron.render(**args)
-                file.write(output)
+    return files
 
 
 # This function just allows us to avoid declaring a variable called 'switch',
@@ -98,62 +93,60 @@ def label(text, render):
 #    actual class, which will be read from another part of the file.
 #  - attributes with multiplicity of 1..n or 0..n will be std::lists
 #    of pointers to classes read from a different part of the file
-def attribute_type(attribute):
+# We need to know which class types are secretly float primitives or enums,
+# these are read from the file directly into an attribute instead of creating
+# a class. The float and enum classes are part of the class details, so the
+# type is worked out once per attribute before the templates are rendered.
+def _set_attribute_types(class_details):
+    for attribute in class_details["attributes"]:
+        attribute["attribute_type"] = _attribute_type(
+            attribute, class_details["float_classes"], class_details["enum_classes"]
+        )
+
+
+def _attribute_type(attribute, float_classes, enum_classes):
     class_name = attribute["class_name"]
     if attribute["multiplicity"] == "M:0..n" or attribute["multiplicity"] == "M:1..n":
         return "list"
     if (
-        is_a_float_class(class_name)
+        class_name in float_classes
         or class_name == "String"
         or class_name == "Boolean"
         or class_name == "Integer"
-        or is_an_enum_class(class_name)
+        or class_name in enum_classes
     ):
         return "primitive"
     else:
         return "class"
 
 
-# We need to keep track of which class types are secretly float
-# primitives. We will use a different template to create the class
-# definitions, and we will read them from the file directly into
-# an attribute instead of creating a class.
-float_classes = {}
-
-
-def set_float_classes(new_float_classes):
-    for new_class in new_float_classes:
-        float_classes[new_class] = new_float_classes[new_class]
-
-
-def is_a_float_class(name):
-    if name in float_classes:
-        return float_classes[name]
-
-
-enum_classes = {}
-
-
-def set_enum_classes(new_enum_classes):
-    for new_class in new_enum_classes:
-        enum_classes[new_class] = new_enum_classes[new_class]
+def attribute_type(attribute):
+    return attribute["attribute_type"]
 
 
-def is_an_enum_class(name):
-    if name in enum_classes:
-        return enum_classes[name]
+# The code the templates insert for the attributes is worked out from the
+# attribute dictionaries before the templates are rendered, the templates only
+# insert the results.
+def _set_attribute_code(class_details):
+    attributes = class_details["attributes"]
+    for attribute in attributes:
+        attribute["attribute_decl"] = _attribute_decl(attribute)
+        attribute["insert_assign"] = insert_assign_fn(attribute)
+        attribute["create_assign"] = create_assign(attribute)
+        attribute["create_class_assign"] = create_class_assign(attribute)
+    class_details["attribute_includes"] = _create_attribute_includes(attributes)
+    class_details[
+        "attribute_class_declarations"
+    ] = _create_attribute_class_declarations(attributes)
 
 
 # These insert_ functions are used to generate the entries in the dynamic_switch
 # maps, for use in assignments.cpp and Task.cpp
 # TODO: implement this as one function, determine in template if it should be called.
-# TODO: reorganize json object so we don't have to keep doing the same processing.
-def insert_assign_fn(text, render):
-    attribute_txt = render(text)
-    attribute_json = eval(attribute_txt)
-    primitive = attribute_type(attribute_json) == "primitive"
-    label = attribute_json["label"]
-    class_name = attribute_json["domain"]
+def insert_assign_fn(attribute):
+    primitive = attribute_type(attribute) == "primitive"
+    label = attribute["label"]
+    class_name = attribute["domain"]
     if primitive:
         return "OUTPUT FROM insert_assign_fn" + label + " in " + class_name + "\n"
     else:
@@ -177,19 +170,14 @@ def get_dataType_and_range(attribute):
 
 # These create_ functions are used to generate the implementations for
 # the entries in the dynamic_switch maps referenced in assignments.cpp and Task.cpp
-def create_class_assign(text, render):
+def create_class_assign(attribute):
     # TODO REMOVE:
     return ""
-    attribute_txt = render(text)
-    attribute_json = eval(attribute_txt)
     assign = ""
-    attribute_class = attribute_json["class_name"]
-    if attribute_type(attribute_json) == "primitive":
+    attribute_class = attribute["class_name"]
+    if attribute_type(attribute) == "primitive":
         return ""
-    if (
-        attribute_json["multiplicity"] == "M:0..n"
-        or attribute_json["multiplicity"] == "M:1..n"
-    ):
+    if attribute["multiplicity"] == "M:0..n" or attribute["multiplicity"] == "M:1..n":
         assign = (
             """
         OUTPUT FROM create_class_assign case 1
@@ -198,17 +186,17 @@ def create_class_assign(text, render):
             and Object Class as OBJECT_CLASS
             and Attribute Class as ATTRIBUTE_CLASS
     """.replace(
-                "OBJECT_CLASS", attribute_json["domain"]
+                "OBJECT_CLASS", attribute["domain"]
             )
             .replace("ATTRIBUTE_CLASS", attribute_class)
-            .replace("LABEL", attribute_json["label"])
+            .replace("LABEL", attribute["label"])
         )
     elif (
-        "inverseRole" in attribute_json
-        and "associationUsed" in attribute_json
-        and attribute_json["associationUsed"] != "No"
+        "inverseRole" in attribute
+        and "associationUsed" in attribute
+        and attribute["associationUsed"] != "No"
     ):
-        inverse = attribute_json["inverseRole"].split(".")
+        inverse = attribute["inverseRole"].split(".")
         assign = (
             """
         OUTPUT FROM create_class_assign case 2
@@ -218,10 +206,10 @@ def create_class_assign(text, render):
             and Inversec as INVERSEC
             and Inversel as INVERSEL
 	""".replace(
-                "OBJECT_CLASS", attribute_json["domain"]
+                "OBJECT_CLASS", attribute["domain"]
             )
             .replace("ATTRIBUTE_CLASS", attribute_class)
-            .replace("LABEL", attribute_json["label"])
+            .replace("LABEL", attribute["label"])
             .replace("INVERSEC", inverse[0])
             .replace("INVERSEL", inverse[1])
         )
@@ -233,22 +221,20 @@ def create_class_assign(text, render):
             and Object Class as OBJECT_CLASS
             and Attribute Class as ATTRIBUTE_CLASS
 	""".replace(
-                "OBJECT_CLASS", attribute_json["domain"]
+                "OBJECT_CLASS", attribute["domain"]
             )
             .replace("ATTRIBUTE_CLASS", attribute_class)
-            .replace("LABEL", attribute_json["label"])
+            .replace("LABEL", attribute["label"])
         )
     return assign
 
 
-def create_assign(text, render):
-    attribute_txt = render(text)
-    attribute_json = eval(attribute_txt)
+def create_assign(attribute):
     assign = ""
-    _class = attribute_json["class_name"]
-    if not attribute_type(attribute_json) == "primitive":
+    _class = attribute["class_name"]
+    if not attribute_type(attribute) == "primitive":
         return ""
-    label_without_keyword = attribute_json["label"]
+    label_without_keyword = attribute["label"]
     if label_without_keyword == "switch":
         label_without_keyword = "_switch"
 
@@ -262,14 +248,14 @@ def create_assign(text, render):
         """.replace(
             "CLASS", _class
         ).replace(
-            "LABEL", attribute_json["label"]
+            "LABEL", attribute["label"]
         )
     else:
         assign = """
         """.replace(
-            "CLASS", attribute_json["domain"]
+            "CLASS", attribute["domain"]
         ).replace(
-            "LABEL", attribute_json["label"]
+            "LABEL", attribute["label"]
         )
 
     return assign
@@ -286,12 +272,6 @@ def _get_rid_of_hash(name):
     return name
 
 
-def attribute_decl(text, render):
-    attribute_txt = render(text)
-    attribute_json = eval(attribute_txt)
-    return _attribute_decl(attribute_json)
-
-
 def _attribute_decl(attribute):
     _type = attribute_type(attribute)
     _class = attribute["class_name"]
@@ -303,19 +283,14 @@ def _attribute_decl(attribute):
         return _class
 
 
-def _create_attribute_includes(text, render):
+def _create_attribute_includes(attributes):
     unique = {}
     include_string = ""
-    inputText = render(text)
-    jsonString = inputText.replace("'", '"')
-    jsonStringNoHtmlEsc = jsonString.replace("&quot;", '"')
-    if jsonStringNoHtmlEsc != None and jsonStringNoHtmlEsc != "":
-        attributes = json.loads(jsonStringNoHtmlEsc)
-        for attribute in attributes:
-            _type = attribute_type(attribute)
-            class_name = attribute["class_name"]
-            if class_name != "" and class_name not in unique:
-                unique[class_name] = _type
+    for attribute in attributes:
+        _type = attribute_type(attribute)
+        class_name = attribute["class_name"]
+        if class_name != "" and class_name not in unique:
+            unique[class_name] = _type
     for clarse in unique:
         if unique[clarse] == "primitive":
             if clarse != "String":
@@ -324,19 +299,14 @@ def _create_attribute_includes(text, render):
     return include_string
 
 
-def _create_attribute_class_declarations(text, render):
+def _create_attribute_class_declarations(attributes):
     unique = {}
     include_string = ""
-    inputText = render(text)
-    jsonString = inputText.replace("'", '"')
-    jsonStringNoHtmlEsc = jsonString.replace("&quot;", '"')
-    if jsonStringNoHtmlEsc != None and jsonStringNoHtmlEsc != "":
-        attributes = json.loads(jsonStringNoHtmlEsc)
-        for attribute in attributes:
-            _type = attribute_type(attribute)
-            class_name = attribute["class_name"]
-            if class_name != "" and class_name not in unique:
-                unique[class_name] = _type
+    for attribute in attributes:
+        _type = attribute_type(attribute)
+        class_name = attribute["class_name"]
+        if class_name != "" and class_name not in unique:
+            unique[class_name] = _type
     for clarse in unique:
         if unique[clarse] == "class" or unique[clarse] == "list":
             include_string += "\nimport cim4j." + clarse + ";"
@@ -398,16 +368,11 @@ class_blacklist = [
 iec61970_blacklist = ["CIMClassList", "CIMNamespaces", "Folders", "Task", "IEC61970"]
 
 
-def _is_enum_class(filepath):
-    with open(filepath, encoding="utf-8") as f:
-        try:
-            for line in f:
-                if "enum class" in line:
-                    return True
-        except UnicodeDecodeError as error:
-            print(
-                "Warning: UnicodeDecodeError parsing {0}: {1}".format(filepath, error)
-            )
+def _is_enum_class(directory, filename):
+    try:
+        return "enum class" in directory.read(filename, encoding="utf-8")
+    except UnicodeDecodeError as error:
+        print("Warning: UnicodeDecodeError parsing {0}: {1}".format(filename, error))
     return False
 
 
@@ -416,13 +381,11 @@ def _create_header_include_file(
 ):
     lines = []
 
-    for filename in os.listdir(directory):
-        filepath = os.path.join(directory, filename)
-        basepath, ext = os.path.splitext(filepath)
-        basename = os.path.basename(basepath)
+    for filename in directory.filenames():
+        basename, ext = os.path.splitext(filename)
         if (
             ext == ".java"
-            and not _is_enum_class(filepath)
+            and not _is_enum_class(directory, filename)
             and not basename in blacklist
         ):
             lines.append(
@@ -440,12 +403,14 @@ def _create_header_include_file(
         header.append(line)
     for line in footer:
         header.append(line)
-    header_include_filepath = os.path.join(directory, header_include_filename)
-    with open(header_include_filepath, "w", encoding="utf-8") as f:
-        f.writelines(header)
+    # unchanged include files keep their modification time, so that an
+    # incremental run does not trigger a rebuild of everything including them
+    directory.write_if_changed(header_include_filename, "".join(header), "utf-8")
 
 
+# outputPath is the output directory or an output target, see output.py
 def resolve_headers(outputPath):
+    outputPath = output.as_output(outputPath)
     class_list_header = [
         "package cim4j;\n",
         "import java.util.Map;\n",
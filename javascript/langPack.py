@@ -1,5 +1,6 @@
 import os
-import chevron
+import template_cache
+import output
 import json
 import sys
 
@@ -8,13 +9,18 @@ def location(version):
     return "BaseClass.hpp"
 
 
+# The class details which depend on other classes used by the templates, see
+# CIMgen.hierarchy_details. The classes list their subclasses.
+hierarchy_details = ("sub_classes",)
+
+
 # This function makes sure we have somewhere to write the classes.
 # cgmes_profile_info details which uri belongs in each profile.
 # We use that to creating the header data for the profiles.
+# It is called once before the classes are rendered.
 def setup(version_path, cgmes_profile_info):
-    if not os.path.exists(version_path):
-        os.makedirs(version_path)
-    class_file = os.path.join(version_path, "CGMESProfile.js")
+    version_path = output.as_output(version_path)
+    version_path.create()
     short_names = {}
     for index, key in enumerate(cgmes_profile_info):
         short_names[key] = index
@@ -26,12 +32,83 @@ def setup(version_path, cgmes_profile_info):
         "shortNames": cgmes_shortname_string,
     }
     write_templated_file(
-        class_file, cgmes_object, "handlebars_cgmesProfile_template.mustache"
+        version_path,
+        "CGMESProfile.js",
+        cgmes_object,
+        "handlebars_cgmesProfile_template.mustache",
+    )
+
+
+# This function is called once after all classes are rendered, with the class
+# details of all classes. The base class gets the entsoe URIs of all profiles.
+def finalize(outputPath, classes):
+    entsoeURIs = []
+    for class_details in classes:
+        entsoeURIs.extend(_entsoe_uris(class_details))
+    write_templated_file(
+        output.as_output(outputPath),
+        "BaseClass.js",
+        {"URI": entsoeURIs},
+        "handlebars_baseclass_template.mustache",
+    )
+    _create_profile_metadata(output.as_output(outputPath), classes)
+
+
+# The profiles of all classes and their attributes are written into one module,
+# ProfileMetadata.js, as bitmasks. The possibleProfileList of the classes is
+# looked up there instead of being built in every class. The unused attributes
+# are left out, like in the classes.
+def _create_profile_metadata(directory, classes):
+    profiles = []
+    if classes:
+        profile_bits = classes[0]["profile_bits"]
+        for name in profile_bits:
+            profiles.append({"name": name, "bit": profile_bits[name]})
+    metadata = []
+    for class_details in sorted(classes, key=lambda details: details["class_name"]):
+        parent = "null"
+        if class_details["super_classes"]:
+            parent = '"' + class_details["super_classes"][0] + '"'
+        metadata.append(
+            {
+                "class_name": class_details["class_name"],
+                "profile_mask": class_details["profile_mask"],
+                "parent": parent,
+                "attributes": _used_attributes(class_details["attributes"]),
+            }
+        )
+    template_path = os.path.join(
+        template_dir, "handlebars_profileMetadata_template.mustache"
+    )
+    text = template_cache.render(
+        template_path, {"profiles": profiles, "classes": metadata}, partials
     )
+    directory.write_if_changed("ProfileMetadata.js", text)
+
+
+# The entsoe URIs are the fixed values of the entsoeURI attributes of the
+# version classes of the profiles.
+def _entsoe_uris(class_details):
+    entsoeURIs = []
+    nameLength = len(class_details["class_name"])
+    if class_details["class_name"][nameLength - 7 :] == "Version":
+        for attribute in class_details["attributes"]:
+            if "entsoeURI" in attribute["about"]:
+                if attribute["isFixed"] is object:
+                    entsoeURIs.append(
+                        {"key": attribute["about"], "value": attribute["isFixed"]["_"]}
+                    )
+                else:
+                    entsoeURIs.append(
+                        {"key": attribute["about"], "value": attribute["isFixed"]}
+                    )
+    return entsoeURIs
 
 
 base = {"base_class": "BaseClass", "class_location": location}
 
+template_dir = os.path.join(os.path.dirname(__file__), "templates")
+
 # These are the files that are used to generate the header and object files.
 # There is a template set for the large number of classes that are floats. They
 # have unit, multiplier and value attributes in the schema, but only appear in
@@ -40,44 +117,12 @@ template_files = [{"filename": "handlebars_template.mustache", "ext": ".js"}]
 
 partials = {}
 
-entsoeURIs = []
-
 
 def neq(one, two):
     print(one, two)
     return one != two
 
 
-# We need to keep track of which class types are secretly float
-# primitives. We will use a different template to create the class
-# definitions, and we will read them from the file directly into
-# an attribute instead of creating a class.
-float_classes = {}
-
-
-def set_float_classes(new_float_classes):
-    for new_class in new_float_classes:
-        float_classes[new_class] = new_float_classes[new_class]
-
-
-def is_a_float_class(name):
-    if name in float_classes:
-        return float_classes[name]
-
-
-enum_classes = {}
-
-
-def set_enum_classes(new_enum_classes):
-    for new_class in new_enum_classes:
-        enum_classes[new_class] = new_enum_classes[new_class]
-
-
-def is_an_enum_class(name):
-    if name in enum_classes:
-        return enum_classes[name]
-
-
 def get_class_location(class_name, class_map, version):
     pass
 
@@ -119,9 +164,10 @@ aggregateRenderer = {
 }
 
 
-def selectPrimitiveRenderFunction(primitive):
+def selectPrimitiveRenderFunction(class_details):
+    primitive = class_details["class_name"]
     render = ""
-    if is_a_float_class(primitive):
+    if class_details["is_a_float"]:
         render = aggregateRenderer["renderFloat"]
     elif primitive == "String":
         render = aggregateRenderer["renderString"]
@@ -145,21 +191,14 @@ def selectPrimitiveRenderFunction(primitive):
     return render
 
 
-# This is the function that runs the template.
+# This is the function that runs the template. It returns the rendered files
+# by file name, CIMgen writes them into the output directory.
 def run_template(outputPath, class_details):
-    nameLength = len(class_details["class_name"])
-    if class_details["class_name"][nameLength - 7 :] == "Version":
-        for attribute in class_details["attributes"]:
-            if "entsoeURI" in attribute["about"]:
-                if attribute["isFixed"] is object:
-                    entsoeURIs.append(
-                        {"key": attribute["about"], "value": attribute["isFixed"]["_"]}
-                    )
-                else:
-                    entsoeURIs.append(
-                        {"key": attribute["about"], "value": attribute["isFixed"]}
-                    )
-
+    # the class details are passed to finalize as well, the unused attributes
+    # are only removed from the attributes which are rendered
+    class_details = dict(
+        class_details, attributes=_used_attributes(class_details["attributes"])
+    )
     class_details["is_not_terminal"] = class_details["class_name"] != "Terminal"
     for attr in class_details["attributes"]:
         if "range" in attr:
@@ -167,16 +206,12 @@ def run_template(outputPath, class_details):
         elif "dataType" in attr:
             attr["attributeClass"] = _get_rid_of_hash(attr["dataType"])
 
-    for index, attribute in enumerate(class_details["attributes"]):
-        if is_an_unused_attribute(attribute) == True:
-            del class_details["attributes"][index]
-
     renderAttribute = ""
     attrType = attribute_type(class_details)
     if attrType == "enum":
         renderAttribute = aggregateRenderer["renderInstance"]
     elif attrType == "primitive":
-        renderAttribute = selectPrimitiveRenderFunction(class_details["class_name"])
+        renderAttribute = selectPrimitiveRenderFunction(class_details)
     else:
         renderAttribute = aggregateRenderer["renderClass"]
     if renderAttribute == "":
@@ -184,28 +219,31 @@ def run_template(outputPath, class_details):
         sys.exit(1)
     class_details["renderAttribute"] = renderAttribute
 
+    files = {}
     for template_info in template_files:
-        class_file = os.path.join(
-            outputPath, class_details["class_name"] + template_info["ext"]
+        class_file = class_details["class_name"] + template_info["ext"]
+        template_path = os.path.join(template_dir, template_info["filename"])
+        files[class_file] = template_cache.render(
+            template_path, class_details, partials
         )
-        write_templated_file(class_file, class_details, template_info["filename"])
+    return files
 
-    class_file = os.path.join(outputPath, "BaseClass.js")
-    write_templated_file(
-        class_file, {"URI": entsoeURIs}, "handlebars_baseclass_template.mustache"
+
+# The files written by setup and finalize depend on all classes, so they are
+# written in every run. An unchanged file keeps its modification time.
+def write_templated_file(output_target, class_file, class_details, template_filename):
+    template_path = os.path.join(template_dir, template_filename)
+    output_target.write_if_changed(
+        class_file, template_cache.render(template_path, class_details, partials)
     )
 
 
-def write_templated_file(class_file, class_details, template_filename):
-    if not os.path.exists(class_file):
-        with open(class_file, "w") as file:
-            template_path = os.path.join(
-                os.getcwd(), "javascript/templates", template_filename
-            )
-            with open(template_path) as f:
-                args = {"data": class_details, "template": f, "partials_dict": partials}
-                output = chevron.render(**args)
-            file.write(output)
+def _used_attributes(attributes):
+    attributes = list(attributes)
+    for index, attribute in enumerate(attributes):
+        if is_an_unused_attribute(attribute) == True:
+            del attributes[index]
+    return attributes
 
 
 def is_an_unused_attribute(attr_details, debug=False):
@@ -222,13 +260,13 @@ def is_an_unused_attribute(attr_details, debug=False):
 def attribute_type(class_details):
     class_name = class_details["class_name"]
     if (
-        is_a_float_class(class_name)
+        class_details["is_a_float"]
         or class_name == "String"
         or class_name == "Boolean"
         or class_name == "Integer"
     ):
         return "primitive"
-    if is_an_enum_class(class_name):
+    if class_details["has_instances"]:
         return "enum"
     return "class"
 
@@ -0,0 +1,255 @@
+import os
+import io
+import json
+import hashlib
+import tarfile
+import zipfile
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Incremental generation: the manifest in the output directory records, for
+# every generated class, a hash of everything its files are rendered from and
+# the names of these files. On the next run only the classes with a different
+# hash are rendered and written again, the files of all other classes are left
+# alone so that they keep their modification time. Files of classes which are
+# not generated anymore are removed.
+
+manifest_filename = ".cimgen_manifest.json"
+manifest_version = 1
+
+
+def write_file(path, text, overwrite=False):
+    """Writes text to path, an existing file is only replaced if overwrite is set"""
+    if overwrite or not os.path.exists(path):
+        with open(path, "w") as f:
+            f.write(text)
+
+
+def write_if_changed(path, text, encoding=None):
+    """Writes text to path unless the file already has this content, which keeps its modification time"""
+    if os.path.exists(path):
+        with open(path, encoding=encoding) as f:
+            if f.read() == text:
+                return
+    with open(path, "w", encoding=encoding) as f:
+        f.write(text)
+
+
+def load_manifest(output_path):
+    """Returns the classes recorded in the manifest of output_path, {} if there is none"""
+    try:
+        with open(os.path.join(output_path, manifest_filename)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get("version") != manifest_version:
+        return {}
+    return manifest["classes"]
+
+
+def save_manifest(output_path, classes):
+    manifest = {"version": manifest_version, "classes": classes}
+    write_if_changed(
+        os.path.join(output_path, manifest_filename),
+        json.dumps(manifest, indent=1, sort_keys=True),
+    )
+
+
+def fingerprint(file_paths):
+    """Hash of the content of the given files, e.g. the langPack module and its templates"""
+    sha = hashlib.sha256()
+    for file_path in sorted(file_paths):
+        sha.update(os.path.basename(file_path).encode())
+        with open(file_path, "rb") as f:
+            sha.update(f.read())
+    return sha.hexdigest()
+
+
+def class_hash(class_details, version, generator_fingerprint):
+    """Hash of the class model and of the generator the files of a class are rendered with"""
+    sha = hashlib.sha256(generator_fingerprint.encode())
+    sha.update(version.encode())
+    sha.update(json.dumps(class_details, sort_keys=True).encode())
+    return sha.hexdigest()
+
+
+def files_exist(output_path, filenames):
+    for filename in filenames:
+        if not os.path.exists(os.path.join(output_path, filename)):
+            return False
+    return True
+
+
+def remove_files(output_path, filenames):
+    for filename in filenames:
+        path = os.path.join(output_path, filename)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+# Output targets. The generated files are written into a directory, into memory
+# or, if the output path ends with one of the archive extensions, into an
+# archive. The langPacks write, read and list their files through the target,
+# so that setup, finalize and resolve_headers work for all of them. A path
+# passed to a langPack instead of a target is used as directory.
+
+archive_extensions = (".zip", ".tar", ".tar.zst")
+
+
+def open_output(path):
+    """Returns the output target for path, an Archive if path has an archive extension, a Directory otherwise"""
+    if path.endswith(archive_extensions):
+        return Archive(path)
+    return Directory(path)
+
+
+def as_output(path_or_target):
+    if isinstance(path_or_target, str):
+        return Directory(path_or_target)
+    return path_or_target
+
+
+class Directory:
+    def __init__(self, path):
+        self.path = path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        pass
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def create(self):
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+
+    def has_file(self, filename):
+        return os.path.exists(os.path.join(self.path, filename))
+
+    def filenames(self):
+        return os.listdir(self.path)
+
+    def read(self, filename, encoding=None):
+        with open(os.path.join(self.path, filename), encoding=encoding) as f:
+            return f.read()
+
+    def write(self, filename, text, overwrite=False):
+        write_file(os.path.join(self.path, filename), text, overwrite)
+
+    def write_if_changed(self, filename, text, encoding=None):
+        write_if_changed(os.path.join(self.path, filename), text, encoding)
+
+
+# The files are collected in memory, e.g. for the in-memory generation API of
+# CIMgen, which returns them without touching the filesystem.
+class Memory:
+    path = ""
+
+    def __init__(self):
+        self._files = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        pass
+
+    def exists(self):
+        return False
+
+    def create(self):
+        pass
+
+    def has_file(self, filename):
+        return filename in self._files
+
+    def filenames(self):
+        return list(self._files)
+
+    def read(self, filename, encoding=None):
+        return self._files[filename]
+
+    def write(self, filename, text, overwrite=False):
+        if overwrite or filename not in self._files:
+            self._files[filename] = text
+
+    def write_if_changed(self, filename, text, encoding=None):
+        self._files[filename] = text
+
+    def files(self):
+        """Returns {relative path: content encoded as UTF-8}, in the order of the paths"""
+        files = {}
+        for filename in sorted(self._files):
+            files[filename] = self._files[filename].encode("utf-8")
+        return files
+
+
+# The files of an archive are collected in memory while the classes are
+# generated and written when the archive is closed, so that files can still be
+# replaced (e.g. by resolve_headers). They are written in the order of their
+# names with a fixed timestamp, which makes the archive independent of the order
+# in which the classes were rendered and of the time of the run.
+class Archive(Memory):
+    # 1980-01-01 is the earliest date a zip file can store
+    timestamp = 315532800
+
+    def __init__(self, path):
+        if path.endswith(".tar.zst") and zstandard is None:
+            raise ImportError("writing .tar.zst archives needs the zstandard package")
+        Memory.__init__(self)
+        self.path = path
+
+    def __exit__(self, exc_type, *exc_info):
+        # a failed run must not leave an incomplete archive behind
+        if exc_type is None:
+            self.close()
+
+    def close(self):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        if self.path.endswith(".zip"):
+            self._write_zip()
+        elif self.path.endswith(".tar.zst"):
+            with open(self.path, "wb") as f:
+                compressor = zstandard.ZstdCompressor()
+                with compressor.stream_writer(f) as stream:
+                    self._write_tar(stream, "w|")
+        else:
+            with open(self.path, "wb") as f:
+                self._write_tar(f, "w")
+
+    def _write_zip(self):
+        date_time = (1980, 1, 1, 0, 0, 0)
+        with zipfile.ZipFile(self.path, "w", zipfile.ZIP_DEFLATED) as archive:
+            files = self.files()
+            for filename in files:
+                info = zipfile.ZipInfo(filename, date_time)
+                info.compress_type = zipfile.ZIP_DEFLATED
+                info.external_attr = 0o644 << 16
+                archive.writestr(info, files[filename])
+
+    def _write_tar(self, fileobj, mode):
+        with tarfile.open(
+            fileobj=fileobj, mode=mode, format=tarfile.PAX_FORMAT
+        ) as archive:
+            files = self.files()
+            for filename in files:
+                data = files[filename]
+                info = tarfile.TarInfo(filename)
+                info.size = len(data)
+                info.mtime = self.timestamp
+                info.mode = 0o644
+                archive.addfile(info, io.BytesIO(data))
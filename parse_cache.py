@@ -0,0 +1,86 @@
+import os
+import pickle
+import hashlib
+import tempfile
+
+# On-disk cache of parsed schema files. The result of parsing an RDF file is
+# pickled into the cache directory under a key made of the SHA-256 of the file
+# content, the CGMES version and the parser version, so a changed schema file,
+# another version or a new parser never hit an old entry. The modification time
+# of an entry is updated when it is used, the least recently used entries are
+# removed once the cache grows beyond its maximum size.
+
+default_max_size = 256 * 1024 * 1024
+
+
+def key(file_path, version, parser_version):
+    sha = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    sha.update(version.encode())
+    sha.update(str(parser_version).encode())
+    return sha.hexdigest()
+
+
+def _entry_path(cache_dir, key):
+    return os.path.join(cache_dir, key + ".pickle")
+
+
+def load(cache_dir, key):
+    """Returns the cached object for key, None if there is no usable entry"""
+    path = _entry_path(cache_dir, key)
+    try:
+        with open(path, "rb") as f:
+            value = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        return None
+    # mark the entry as recently used
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return value
+
+
+def store(cache_dir, key, value):
+    """Stores value for key, the entry is written to a temporary file first so
+    that concurrent readers (e.g. other worker processes) never see a partial entry"""
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, _entry_path(cache_dir, key))
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def evict(cache_dir, max_size=default_max_size):
+    """Removes the least recently used entries until the cache is at most max_size bytes"""
+    entries = []
+    total_size = 0
+    try:
+        filenames = os.listdir(cache_dir)
+    except OSError:
+        return
+    for filename in filenames:
+        if not filename.endswith(".pickle"):
+            continue
+        path = os.path.join(cache_dir, filename)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+        total_size += stat.st_size
+    entries.sort()
+    for mtime, size, path in entries:
+        if total_size <= max_size:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        total_size -= size
@@ -1,22 +1,37 @@
 import os
-import chevron
+import template_cache
+import output
 import logging
-import glob
 import sys
 
 logger = logging.getLogger(__name__)
 
+# The output options, they are passed to build.py with --langpack-option and
+# reach the templates as options in the class details.
+options = {
+    "lazy_docs": "Assemble the documentation of the parent classes when __doc__ is read instead of at import time",
+    "slots": "Keep the attributes of the instances in __slots__ instead of a __dict__",
+}
+
+
+# The class details which depend on other classes used by the templates, see
+# CIMgen.hierarchy_details. The constructors set the inherited attributes.
+hierarchy_details = ("inherited_attributes",)
+
 
 # This makes sure we have somewhere to write the classes, and
 # creates a couple of files the python implementation needs.
 # cgmes_profile_info details which uri belongs in each profile.
 # We don't use that here because we aren't creating the header
 # data for the separate profiles.
-def setup(version_path, cgmes_profile_info):
-    if not os.path.exists(version_path):
-        os.makedirs(version_path)
+def setup(version_path, cgmes_profile_info, options=None):
+    options = options or {}
+    version_path = output.as_output(version_path)
+    if not version_path.exists():
+        version_path.create()
         _create_init(version_path)
-        _create_base(version_path)
+    # the base class depends on the options, which can change between runs
+    _create_base(version_path, options)
 
 
 def location(version):
@@ -25,6 +40,7 @@ def location(version):
 
 base = {"base_class": "Base", "class_location": location}
 
+template_dir = os.path.join(os.path.dirname(__file__), "templates")
 template_files = [{"filename": "cimpy_class_template.mustache", "ext": ".py"}]
 
 
@@ -71,80 +87,171 @@ def _set_default(text, render):
         return "0.0"
 
 
-def set_enum_classes(new_enum_classes):
-    return
-
-
-def set_float_classes(new_float_classes):
-    return
-
-
+# Runs the template and returns the rendered file by file name, CIMgen writes it
+# into the output directory.
 def run_template(version_path, class_details):
+    class_details["setDefault"] = _set_default
+    _set_init_attributes(class_details)
+    files = {}
     for template_info in template_files:
-        class_file = os.path.join(
-            version_path, class_details["class_name"] + template_info["ext"]
+        class_file = class_details["class_name"] + template_info["ext"]
+        template_path = os.path.join(template_dir, template_info["filename"])
+        files[class_file] = template_cache.render(
+            template_path, class_details, partials
         )
-        if not os.path.exists(class_file):
-            with open(class_file, "w") as file:
-                template_path = os.path.join(
-                    os.getcwd(), "python/templates", template_info["filename"]
-                )
-                class_details["setDefault"] = _set_default
-                with open(template_path) as f:
-                    args = {
-                        "data": class_details,
-                        "template": f,
-                        "partials_dict": partials,
-                    }
-                    output = chevron.render(**args)
-                file.write(output)
+    return files
+
+
+# The constructor of a class sets the inherited attributes as well, instead of
+# passing them on to the constructor of the parent class. The parameters are in
+# the order of the former chain of constructors: the own attributes first, then
+# those of the parent class and so on. The attributes are assigned starting with
+# those of the root class, like the chain did, which keeps the order of __str__.
+def _set_init_attributes(class_details):
+    classes = [class_details["attributes"]]
+    for super_class in class_details["inherited_attributes"]:
+        classes.append(super_class["attributes"])
+    init_attributes = []
+    labels = set()
+    for attributes in classes:
+        for attribute in attributes:
+            if attribute["label"] not in labels:
+                labels.add(attribute["label"])
+                init_attributes.append(attribute)
+    assigned_attributes = []
+    labels = set()
+    for attributes in reversed(classes):
+        for attribute in attributes:
+            if attribute["label"] not in labels:
+                labels.add(attribute["label"])
+                assigned_attributes.append(attribute)
+    class_details["init_attributes"] = init_attributes
+    class_details["assigned_attributes"] = assigned_attributes
 
 
 def _create_init(path):
-    init_file = path + "/__init__.py"
-    with open(init_file, "w"):
-        pass
+    path.write("__init__.py", "", overwrite=True)
 
 
 # creates the Base class file, all classes inherit from this class
-def _create_base(path):
-    base_path = path + "/Base.py"
+def _create_base(path, options):
     base = [
-        "from enum import Enum\n\n",
+        "from enum import Enum\n",
+        "from .profile_metadata import classes, possible_profile_list, profile_bits\n",
         "\n",
+        "# the values of the CGMES 2.4.15 profiles, the other profiles of this version follow them\n",
+        'profile_values = {"EQ": 0, "SSH": 1, "TP": 2, "SV": 3, "DY": 4, "GL": 5, "DL": 6, "TP_BD": 7, "EQ_BD": 8}\n',
+        "for profile in profile_bits:\n",
+        "    profile_values.setdefault(profile, len(profile_values))\n",
+        "\n\n",
+        "class ProfileList:\n",
+        '    """\n',
+        "    possibleProfileList of a class, looked up in the profile metadata when it is read\n",
+        '    """\n\n',
+        "    def __get__(self, instance, owner):\n",
+        "        if owner.__name__ not in classes:\n",
+        '            raise AttributeError("possibleProfileList")\n',
+        "        try:\n",
+        "            return possible_profile_list(owner.__name__, owner.cgmesProfile)\n",
+        "        except KeyError:\n",
+        '            raise AttributeError("possibleProfileList")\n',
+        "\n\n",
         "class Base():\n",
         '    """\n',
         "    Base Class for CIM\n",
         '    """\n\n',
-        '    cgmesProfile = Enum("cgmesProfile", {"EQ": 0, "SSH": 1, "TP": 2, "SV": 3, "DY": 4, "GL": 5, "DL": 6, "TP_BD": 7, "EQ_BD": 8})',
-        "\n\n",
+    ]
+    if options.get("slots"):
+        base.append("    __slots__ = ()\n\n")
+    base += [
+        '    cgmesProfile = Enum("cgmesProfile", profile_values)\n',
+        "\n",
+        "    possibleProfileList = ProfileList()\n",
+        "\n",
         "    def __init__(self, *args, **kw_args):\n",
         "        pass\n",
         "\n",
         "    def printxml(self, dict={}):\n",
         "        return dict\n",
     ]
+    # InheritedDoc is part of Base.py without the lazy_docs option as well: the
+    # existing class files are kept in a run which is not incremental, so they
+    # can come from a run with the option.
+    base += lazy_docs_base
+
+    path.write_if_changed("Base.py", "".join(base))
 
-    with open(base_path, "w") as f:
-        for line in base:
-            f.write(line)
+
+# With the lazy_docs option the docstring of a class is followed by the documentation of its parent class when it is
+# read, instead of concatenating the docstrings of all parent classes at import time and keeping them in memory.
+lazy_docs_base = [
+    "\n\n",
+    "class InheritedDoc:\n",
+    '    """\n',
+    "    Docstring of a class, followed by the documentation of its parent class when it is read\n",
+    '    """\n\n',
+    "    def __init__(self, doc):\n",
+    "        self.doc = doc\n",
+    "\n",
+    "    def __get__(self, instance, owner):\n",
+    "        parent = owner.__bases__[0]\n",
+    "        return (\n",
+    "            self.doc\n",
+    '            + "\\n Documentation of parent class "\n',
+    "            + parent.__name__\n",
+    '            + ": \\n"\n',
+    "            + parent.__doc__\n",
+    "        )\n",
+]
+
+
+# The profiles of all classes and their attributes are written into one module,
+# profile_metadata.py, as bitmasks. The possibleProfileList of the classes is
+# looked up there, see Base.py, instead of being built in every class body.
+profile_metadata = "profile_metadata"
+
+
+# This is called after all classes are rendered, with the class details of all
+# classes, and writes the profile metadata module.
+def finalize(outputPath, classes):
+    profiles = []
+    if classes:
+        profile_bits = classes[0]["profile_bits"]
+        for name in profile_bits:
+            profiles.append({"name": name, "bit": profile_bits[name]})
+    metadata = []
+    for class_details in sorted(classes, key=lambda details: details["class_name"]):
+        parent = "None"
+        if class_details["super_classes"]:
+            parent = '"' + class_details["super_classes"][0] + '"'
+        metadata.append(
+            {
+                "class_name": class_details["class_name"],
+                "profile_mask": class_details["profile_mask"],
+                "parent": parent,
+                "attributes": class_details["attributes"],
+            }
+        )
+    template_path = os.path.join(
+        template_dir, "cimpy_profile_metadata_template.mustache"
+    )
+    text = template_cache.render(
+        template_path, {"profiles": profiles, "classes": metadata}, partials
+    )
+    output.as_output(outputPath).write_if_changed(profile_metadata + ".py", text)
 
 
+# Writes the __init__.py of the package, which imports the classes lazily on
+# first access. path is the output directory or an output target, see output.py
 def resolve_headers(path):
-    filenames = glob.glob(path + "/*.py")
-    include_names = []
-    for filename in filenames:
-        include_names.append(os.path.splitext(os.path.basename(filename))[0])
-    with open(path + "/__init__.py", "w") as header_file:
-        for include_name in include_names:
-            header_file.write(
-                "from "
-                + "."
-                + include_name
-                + " import "
-                + include_name
-                + " as "
-                + include_name
-                + "\n"
-            )
-        header_file.close()
+    path = output.as_output(path)
+    class_names = []
+    for filename in path.filenames():
+        name, ext = os.path.splitext(filename)
+        if ext == ".py" and not name.startswith((".", "__")):
+            if name != profile_metadata:
+                class_names.append(name)
+    class_names.sort()
+    template_path = os.path.join(template_dir, "cimpy_init_template.mustache")
+    init = template_cache.render(template_path, {"classes": class_names}, partials)
+    path.write_if_changed("__init__.py", init)
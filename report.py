@@ -0,0 +1,121 @@
+import json
+import tracemalloc
+from time import perf_counter
+from contextlib import contextmanager
+
+# Instrumentation of a generation run. The stages of a run (parsing, merging,
+# emitting, ...) are timed with the wall clock in the main process. The phases
+# within a stage (reading the files, parsing the XML, rendering the templates,
+# writing the files, ...) are timed where they happen, which can be a worker
+# process, and summed up, so with several workers their sum can exceed the
+# wall time of the stage. If memory tracing is enabled, the memory allocated by
+# the main process is traced with tracemalloc and the current and peak size and
+# the largest allocation sites are recorded at the end of every stage.
+
+
+class RunReport:
+    def __init__(self, callback=None, trace_memory=False, top_allocations=10):
+        """
+        :param callback:        called as callback(stage, report) after every stage, report is the result of as_dict
+        :param trace_memory:    trace the memory allocations of the main process with tracemalloc
+        :param top_allocations: number of allocation sites recorded for every stage if memory is traced
+        """
+        self.callback = callback
+        self.trace_memory = trace_memory
+        self.top_allocations = top_allocations
+        self.info = {}
+        self.stages = {}
+        self.phases = {}
+        self.counters = {}
+        self.memory = {}
+        self._started = None
+        self._finished = None
+
+    @contextmanager
+    def stage(self, name):
+        if self._started is None:
+            self._started = perf_counter()
+            if self.trace_memory and not tracemalloc.is_tracing():
+                tracemalloc.start()
+        t0 = perf_counter()
+        yield
+        self._finished = perf_counter()
+        self.stages[name] = self.stages.get(name, 0.0) + self._finished - t0
+        if self.trace_memory:
+            self.memory[name] = self._memory_record()
+        if self.callback is not None:
+            self.callback(name, self.as_dict())
+
+    def _memory_record(self):
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        top = []
+        statistics = tracemalloc.take_snapshot().statistics("lineno")
+        for statistic in statistics[: self.top_allocations]:
+            frame = statistic.traceback[0]
+            top.append(
+                {
+                    "location": "{}:{}".format(frame.filename, frame.lineno),
+                    "size": statistic.size,
+                    "count": statistic.count,
+                }
+            )
+        return {"current": current, "peak": peak, "top": top}
+
+    def add_phases(self, timings):
+        for name in timings:
+            self.phases[name] = self.phases.get(name, 0.0) + timings[name]
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def total(self):
+        if self._started is None:
+            return 0.0
+        return self._finished - self._started
+
+    def as_dict(self):
+        report = {
+            "info": dict(self.info),
+            "stages": dict(self.stages, total=self.total()),
+            "phases": dict(self.phases),
+            "counters": dict(self.counters),
+        }
+        if self.trace_memory:
+            report["memory"] = dict(self.memory)
+        return report
+
+    def write(self, path):
+        with open(path, "w") as f:
+            json.dump(self.as_dict(), f, indent=1)
+
+
+class TimedFile:
+    """Wraps a file object and adds the time spent reading it to timings[name]"""
+
+    def __init__(self, file, timings, name):
+        self._file = file
+        self._timings = timings
+        self._name = name
+        timings.setdefault(name, 0.0)
+
+    def read(self, size=-1):
+        t0 = perf_counter()
+        data = self._file.read(size)
+        self._timings[self._name] += perf_counter() - t0
+        return data
+
+
+def timed_iter(iterable, timings, name):
+    """Yields the items of iterable and adds the time spent producing them to timings[name]"""
+    timings.setdefault(name, 0.0)
+    iterator = iter(iterable)
+    while True:
+        t0 = perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            timings[name] += perf_counter() - t0
+            return
+        timings[name] += perf_counter() - t0
+        yield item
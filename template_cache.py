@@ -0,0 +1,51 @@
+import threading
+import chevron
+
+# Process wide registry of tokenized mustache templates. Every langPack renders
+# the same handful of templates about a thousand times per run, so each template
+# file (and each partials dict) is read and tokenized once and all renders reuse
+# the cached token list. chevron.render accepts a token list in place of the
+# template text, and does the same for partials.
+
+_lock = threading.Lock()
+_templates = {}
+_partials = {}
+
+
+def _tokenize(template):
+    return list(chevron.tokenizer.tokenize(template))
+
+
+def get_template(template_path):
+    tokens = _templates.get(template_path)
+    if tokens is None:
+        with _lock:
+            tokens = _templates.get(template_path)
+            if tokens is None:
+                with open(template_path) as f:
+                    tokens = _tokenize(f.read())
+                _templates[template_path] = tokens
+    return tokens
+
+
+# The partials dicts are module level constants of the langPacks, so they are
+# cached by identity. The dict itself is kept in the entry to make sure the id
+# is not reused by another object.
+def get_partials(partials):
+    entry = _partials.get(id(partials))
+    if entry is None or entry[0] is not partials:
+        with _lock:
+            tokenized = {}
+            for name in partials:
+                tokenized[name] = _tokenize(partials[name])
+            entry = (partials, tokenized)
+            _partials[id(partials)] = entry
+    return entry[1]
+
+
+def render(template_path, data, partials):
+    return chevron.render(
+        template=get_template(template_path),
+        data=data,
+        partials_dict=get_partials(partials),
+    )